@@ -1,8 +1,27 @@
 from accounts.models import UserProfile
+from accounts.services import UserService
 from django.contrib.auth.models import User
+from django.db import models
 from rest_framework import serializers, exceptions
 
 
+class ListSerializerWithCachedUsers(serializers.ListSerializer):
+    # users and profiles of the whole list are loaded with one get_many each
+    user_id_attr = 'user_id'
+    cached_user_attr = '_cached_user'
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        objects = list(data)
+        UserService.attach_cached_users(
+            objects,
+            self.user_id_attr,
+            self.cached_user_attr,
+        )
+        return super().to_representation(objects)
+
+
 class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -5,6 +5,7 @@ from accounts.api.serializers import (
     UserProfileSerializerForUpdate
 )
 from accounts.models import UserProfile
+from accounts.services import UserService
 from django.contrib.auth import (
     authenticate as django_authenticate,
     login as django_login,
@@ -68,6 +69,7 @@ class AccountViewSet(viewsets.GenericViewSet):
                 'message': 'Username and password do not match.',
             }, status=status.HTTP_400_BAD_REQUEST)
         django_login(request, user)
+        UserService.mark_active(user.id)
 
         return Response({
             'success': True,
@@ -87,6 +89,7 @@ class AccountViewSet(viewsets.GenericViewSet):
 
         user = serializer.save()
         django_login(request, user)
+        UserService.mark_active(user.id)
         return Response({
             'success': True,
             'user': SignupSerializer(user).data
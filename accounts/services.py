@@ -1,25 +1,126 @@
 from accounts.models import UserProfile
 from django.conf import settings
-from django.core.cache import caches
-from twitter.cache import USER_PROFILE_PATTERN
-
-cache = caches['testing'] if settings.TESTING else caches['default']
+from django.contrib.auth.models import User
+from twitter.cache import USER_ACTIVITY_KEY, USER_PROFILE_PATTERN
+from utils.memcached.local_cache import LocalCache
+from utils.memcached.memcached_helper import MemcachedHelper
+from utils.memcached.request_cache import RequestCache
+from utils.memcached.soft_ttl_cache import SoftTTLCache
+from utils.redis.redis_client import RedisClient
+import time
 
 
 class UserService:
 
     @classmethod
     def get_profile_through_memcached(cls, user_id):
-        key = USER_PROFILE_PATTERN.format(user_id=user_id)
-        user_profile = cache.get(key)
-        if user_profile:
-            return user_profile
-
+        profiles = cls.get_profiles_through_memcached([user_id])
+        if user_id in profiles:
+            return profiles[user_id]
+        # profiles are created on first access, a tombstone only spares the
+        # batch lookups
         user_profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
-        cache.set(key, user_profile)
+        MemcachedHelper.set_cached_objects('UserProfile', {
+            USER_PROFILE_PATTERN.format(user_id=user_id): user_profile,
+        })
         return user_profile
 
+    @classmethod
+    def get_profiles_through_memcached(cls, user_ids):
+        # users without a profile yet are left to get_profile_through_memcached
+        return MemcachedHelper.get_cached_objects(
+            user_ids,
+            lambda user_id: USER_PROFILE_PATTERN.format(user_id=user_id),
+            'UserProfile',
+            lambda user_ids: {
+                profile.user_id: profile
+                for profile in UserProfile.objects.filter(user_id__in=user_ids)
+            },
+            cls._refresh_stale_profiles,
+        )
+
+    @classmethod
+    def _refresh_stale_profiles(cls, stale_keys):
+        # {key: user_id} served stale, refreshed by one background task
+        from accounts.tasks import refresh_cached_profiles_task
+
+        keys = SoftTTLCache.acquire_refresh(list(stale_keys))
+        if keys:
+            generations = SoftTTLCache.get_generations(keys)
+            refresh_cached_profiles_task.delay(
+                [stale_keys[key] for key in keys],
+                [generations[key] for key in keys],
+            )
+
+    @classmethod
+    def refresh_cached_profiles(cls, user_ids, generations):
+        # generations of the keys as read before the refresh was enqueued
+        generations = {
+            USER_PROFILE_PATTERN.format(user_id=user_id): generation
+            for user_id, generation in zip(user_ids, generations)
+        }
+        profiles = {
+            USER_PROFILE_PATTERN.format(user_id=profile.user_id): profile
+            for profile in UserProfile.objects.filter(user_id__in=user_ids)
+        }
+        if not profiles:
+            return 0
+        return SoftTTLCache.refresh_many(profiles, generations)
+
+    @classmethod
+    def attach_cached_users(
+            cls,
+            objects,
+            user_id_attr='user_id',
+            cached_user_attr='_cached_user',
+    ):
+        # load the users of a page and their profiles with one get_many each
+        user_ids = [getattr(obj, user_id_attr) for obj in objects]
+        users = MemcachedHelper.get_objects_through_cache(User, user_ids)
+        profiles = cls.get_profiles_through_memcached(list(users))
+        for user_id, user in users.items():
+            if user_id in profiles:
+                user._cached_user_profile = profiles[user_id]
+        for obj in objects:
+            user_id = getattr(obj, user_id_attr)
+            if user_id in users:
+                setattr(obj, cached_user_attr, users[user_id])
+        return objects
+
     @classmethod
     def invalidate_profile_cache(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
-        cache.delete(key)
+        SoftTTLCache.invalidate(key)
+        RequestCache.delete(key)
+        LocalCache.invalidate('UserProfile', key)
+
+    @classmethod
+    def mark_active(cls, user_id):
+        # last login or newsfeed read, one ZADD into a sorted set by time
+        conn = RedisClient.get_connection()
+        conn.zadd(USER_ACTIVITY_KEY, {user_id: int(time.time())})
+
+    @classmethod
+    def get_active_user_ids(cls, user_ids):
+        # users active within NEWSFEED_ACTIVE_USER_WINDOW, ZSCOREs of a whole
+        # batch in one pipeline (ZMSCORE needs redis 6.2)
+        if not user_ids:
+            return set()
+        since = int(time.time()) - settings.NEWSFEED_ACTIVE_USER_WINDOW
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.zscore(USER_ACTIVITY_KEY, user_id)
+        return {
+            user_id
+            for user_id, score in zip(user_ids, pipeline.execute())
+            if score is not None and score >= since
+        }
+
+    @classmethod
+    def prune_dormant_users(cls):
+        # users not seen within the window are dormant whether they are in
+        # the set or not, this keeps the set bounded by the active users
+        since = int(time.time()) - settings.NEWSFEED_ACTIVE_USER_WINDOW
+        conn = RedisClient.get_connection()
+        return conn.zremrangebyscore(USER_ACTIVITY_KEY, '-inf', '({}'.format(since))
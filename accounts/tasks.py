@@ -0,0 +1,14 @@
+from accounts.services import UserService
+from celery import shared_task
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(limit=ONE_HOUR, routing_key='default')
+def prune_dormant_users_task():
+    return '{} dormant users are pruned'.format(UserService.prune_dormant_users())
+
+
+@shared_task(limit=ONE_HOUR, routing_key='default')
+def refresh_cached_profiles_task(user_ids, generations):
+    refreshed = UserService.refresh_cached_profiles(user_ids, generations)
+    return '{} cached profiles are refreshed'.format(refreshed)
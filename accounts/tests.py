@@ -1,4 +1,5 @@
 from accounts.models import UserProfile
+from accounts.services import UserService
 from testing.testcases import TestCase
 
 
@@ -11,3 +12,67 @@ class UserProfileTests(TestCase):
         profile = user.profile
         self.assertEqual(UserProfile.objects.count(), 1)
         self.assertEqual(isinstance(profile, UserProfile), True)
+
+    def test_attach_cached_users(self):
+        self.clear_cache()
+        users = [self.create_user('test_user{}'.format(i)) for i in range(3)]
+        for user in users:
+            profile = user.profile
+            profile.nickname = user.username
+            profile.save()
+        tweets = [self.create_tweet(user) for user in users + users]
+
+        # db on the first call, cache afterwards
+        for _ in range(2):
+            profiles = UserService.get_profiles_through_memcached(
+                [user.id for user in users]
+            )
+            self.assertEqual(
+                set(profile.nickname for profile in profiles.values()),
+                set(user.username for user in users),
+            )
+
+        UserService.attach_cached_users(tweets)
+        for tweet in tweets:
+            self.assertEqual(tweet.cached_user(), tweet.user)
+            self.assertEqual(
+                tweet.cached_user()._cached_user_profile.nickname,
+                tweet.user.username,
+            )
+
+    def test_profile_tombstones(self):
+        self.clear_cache()
+        user = self.create_user('test_user')
+
+        # the batch lookup tombstones a missing profile, the single one
+        # creates it over the tombstone
+        self.assertEqual(UserService.get_profiles_through_memcached([user.id]), {})
+        profile = UserService.get_profile_through_memcached(user.id)
+        self.assertEqual(profile.user_id, user.id)
+        with self.assertNumQueries(0):
+            profiles = UserService.get_profiles_through_memcached([user.id])
+            self.assertEqual(profiles[user.id].id, profile.id)
+            self.assertEqual(
+                UserService.get_profile_through_memcached(user.id).id,
+                profile.id,
+            )
+
+    def test_active_users(self):
+        self.clear_cache()
+        users = [self.create_user('user{}'.format(i)) for i in range(3)]
+        user_ids = [user.id for user in users]
+        self.assertEqual(UserService.get_active_user_ids(user_ids), set())
+
+        UserService.mark_active(users[0].id)
+        UserService.mark_active(users[2].id)
+        self.assertEqual(
+            UserService.get_active_user_ids(user_ids),
+            {users[0].id, users[2].id},
+        )
+        self.assertEqual(UserService.get_active_user_ids([]), set())
+        self.assertEqual(UserService.prune_dormant_users(), 0)
+
+        # outside of the window the users are dormant and pruned
+        with self.settings(NEWSFEED_ACTIVE_USER_WINDOW=-60):
+            self.assertEqual(UserService.get_active_user_ids(user_ids), set())
+            self.assertEqual(UserService.prune_dormant_users(), 2)
@@ -1,11 +1,9 @@
 from accounts.api.serializers import UserSerializerForComment
 from comments.models import Comment
-from likes.services import LikeService
-from random import randint
+from likes.api.serializers import ListSerializerWithLikes
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.models import Tweet
-from utils.redis.redis_helper import RedisHelper
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -25,20 +23,13 @@ class CommentSerializer(serializers.ModelSerializer):
             'has_liked',
             'likes_count',
         )
+        list_serializer_class = ListSerializerWithLikes
 
     def get_has_liked(self, obj):
-        return LikeService.has_liked(self.context['request'].user, obj)
+        return ListSerializerWithLikes.get_has_liked(self.context, obj)
 
     def get_likes_count(self, obj):
-        if randint(0, 999) == 0:
-            obj.refresh_from_db()
-            actual_likes_count = obj.like_set.count()
-            if obj.likes_count != actual_likes_count:
-                obj.likes_count = actual_likes_count
-                obj.save()
-                return actual_likes_count
-
-        return RedisHelper.get_count(obj, 'likes_count')
+        return ListSerializerWithLikes.get_count(self.context, obj, 'likes_count')
 
 
 class CommentSerializerForCreate(serializers.ModelSerializer):
@@ -1,22 +1,32 @@
 from django.db.models import F
+from utils.redis.redis_counters import RedisCounterHelper
 from utils.redis.redis_helper import RedisHelper
 
 
-def incr_comments_count(sender, instance, created, **kwargs):
+def _update_comments_count(instance, amount):
     from tweets.models import Tweet
+
+    if RedisCounterHelper.is_enabled():
+        RedisCounterHelper.add_delta(
+            Tweet,
+            instance.tweet_id,
+            'comments_count',
+            amount,
+        )
+    else:
+        Tweet.objects.filter(id=instance.tweet_id).update(
+            comments_count=F('comments_count') + amount
+        )
+
+
+def incr_comments_count(sender, instance, created, **kwargs):
     if not created:
         return
 
-    Tweet.objects.filter(id=instance.tweet_id).update(
-        comments_count=F('comments_count') + 1
-    )
+    _update_comments_count(instance, 1)
     RedisHelper.incr_count(instance.tweet, 'comments_count')
 
 
 def decr_comments_count(sender, instance, **kwargs):
-    from tweets.models import Tweet
-
-    Tweet.objects.filter(id=instance.tweet_id).update(
-        comments_count=F('comments_count') - 1
-    )
+    _update_comments_count(instance, -1)
     RedisHelper.decr_count(instance.tweet, 'comments_count')
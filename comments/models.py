@@ -37,6 +37,9 @@ class Comment(models.Model):
 
     @property
     def cached_user(self):
+        # set by the batched hydration of a page
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemcachedHelper.get_object_through_cache(User, self.user_id)
 
 
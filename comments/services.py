@@ -0,0 +1,16 @@
+from comments.models import Comment
+from django.db.models import Count
+
+
+class CommentService:
+
+    @classmethod
+    def get_comments_counts(cls, tweet_ids):
+        # {tweet_id: comments count}, tweets without comments are left out
+        return dict(
+            Comment.objects.filter(tweet_id__in=tweet_ids).values(
+                'tweet_id',
+            ).annotate(
+                count=Count('id'),
+            ).values_list('tweet_id', 'count')
+        )
@@ -1,4 +1,7 @@
-from accounts.api.serializers import UserSerializerForFriendship
+from accounts.api.serializers import (
+    ListSerializerWithCachedUsers,
+    UserSerializerForFriendship,
+)
 from friendships.models import Friendship
 from friendships.services import FriendshipService
 from rest_framework import serializers
@@ -21,6 +24,16 @@ class FollowingUserIdSetMixin:
         return following_user_id_set
 
 
+class FollowingListSerializer(ListSerializerWithCachedUsers):
+    user_id_attr = 'to_user_id'
+    cached_user_attr = '_cached_to_user'
+
+
+class FollowerListSerializer(ListSerializerWithCachedUsers):
+    user_id_attr = 'from_user_id'
+    cached_user_attr = '_cached_from_user'
+
+
 class FollowingSerializer(serializers.ModelSerializer, FollowingUserIdSetMixin):
     user = UserSerializerForFriendship(source='cached_to_user')
     has_followed = serializers.SerializerMethodField()
@@ -28,6 +41,7 @@ class FollowingSerializer(serializers.ModelSerializer, FollowingUserIdSetMixin):
     class Meta:
         model = Friendship
         fields = ('user', 'created_at', 'has_followed')
+        list_serializer_class = FollowingListSerializer
 
     def get_has_followed(self, obj):
         return obj.to_user_id in self.following_user_id_set
@@ -40,6 +54,7 @@ class FollowerSerializer(serializers.ModelSerializer, FollowingUserIdSetMixin):
     class Meta:
         model = Friendship
         fields = ('user', 'created_at', 'has_followed')
+        list_serializer_class = FollowerListSerializer
 
     def get_has_followed(self, obj):
         return obj.from_user_id in self.following_user_id_set
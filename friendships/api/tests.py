@@ -1,6 +1,7 @@
 from friendships.models import Friendship
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from utils.time_helpers import utc_now
 from utils.paginations.page_number_paginations import FriendshipPagination
 
 FOLLOW_URL = '/api/friendships/{}/follow/'
@@ -194,6 +195,39 @@ class FriendshipApiTests(TestCase):
             has_followed = result['user']['id'] % 2 == 0
             self.assertEqual(result['has_followed'], has_followed)
 
+    def test_followers_cursor_pagination(self):
+        page_size = FriendshipPagination.page_size
+        for i in range(page_size * 2 + 1):
+            self.create_friendship(self.create_user('test_follower{}'.format(i)), self.user3)
+        # same created_at everywhere, the id breaks the tie
+        Friendship.objects.filter(to_user=self.user3).update(created_at=utc_now())
+        follower_ids = list(
+            Friendship.objects.filter(to_user=self.user3)
+            .order_by('-id')
+            .values_list('from_user_id', flat=True)
+        )
+        url = FOLLOWERS_URL.format(self.user3.id)
+
+        ids = []
+        cursor = ''
+        for has_next_page in (True, True, False):
+            response = self.anonymous_client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['total_count'], page_size * 2 + 1)
+            self.assertEqual(response.data['has_next_page'], has_next_page)
+            ids.extend(result['user']['id'] for result in response.data['results'])
+            cursor = response.data['next_cursor']
+        self.assertEqual(cursor, None)
+        self.assertEqual(ids, follower_ids)
+
+        # the count is cached, new followers show up later
+        self.create_friendship(self.user4, self.user3)
+        response = self.anonymous_client.get(url, {'cursor': ''})
+        self.assertEqual(response.data['total_count'], page_size * 2 + 1)
+
+        response = self.anonymous_client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
     def _test_friendship_pagination(self, url, max_page_size, page_size):
         # test page 1
         response = self.anonymous_client.get(url, {
@@ -1,7 +1,17 @@
 from django.conf import settings
 from django.core.cache import caches
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from friendships.models import Friendship
-from twitter.cache import FOLLOWING_PATTERNS
+from twitter.cache import (
+    CELEBRITY_SINCE_KEY,
+    CELEBRITY_USER_IDS_KEY,
+    DEMOTING_CELEBRITY_IDS_KEY,
+    FOLLOWING_PATTERNS,
+)
+from utils.memcached.request_cache import MISSING
+from utils.redis.redis_client import RedisClient
+import time
 
 cache = caches['testing'] if settings.TESTING else caches['default']
 
@@ -10,16 +20,116 @@ class FriendshipService:
 
     @classmethod
     def get_follower_ids(cls, to_user_id):
-        friendships = Friendship.objects.filter(to_user_id=to_user_id)
-        followers_id = [friendship.from_user_id for friendship in friendships]
+        return list(
+            Friendship.objects.filter(to_user_id=to_user_id)
+            .values_list('from_user_id', flat=True)
+        )
 
-        return followers_id
+    @classmethod
+    def iter_follower_id_chunks(cls, to_user_id, chunk_size, after=None):
+        # keyset pagination on (created_at, id), memory stays bounded by
+        # chunk_size whatever the follower count and no OFFSET scans. innodb
+        # secondary indexes end with the primary key, so the (to_user,
+        # created_at) index serves this order. yields (cursor, follower ids),
+        # the cursor can be passed back as after to resume
+        queryset = Friendship.objects.filter(to_user_id=to_user_id).order_by('created_at', 'id')
+        if after:
+            created_at, friendship_id = cls.decode_follower_cursor(after)
+        while True:
+            chunk = queryset
+            if after:
+                chunk = chunk.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=friendship_id)
+                )
+            rows = list(chunk.values_list('created_at', 'id', 'from_user_id')[:chunk_size])
+            if not rows:
+                return
+            created_at, friendship_id, _ = rows[-1]
+            after = cls.encode_follower_cursor(created_at, friendship_id)
+            yield after, [from_user_id for _, _, from_user_id in rows]
+            if len(rows) < chunk_size:
+                return
+
+    @classmethod
+    def encode_follower_cursor(cls, created_at, friendship_id):
+        return '{}|{}'.format(created_at.isoformat(), friendship_id)
+
+    @classmethod
+    def decode_follower_cursor(cls, cursor):
+        created_at, friendship_id = cursor.rsplit('|', 1)
+        return parse_datetime(created_at), int(friendship_id)
+
+    @classmethod
+    def get_follower_count(cls, to_user_id):
+        return Friendship.objects.filter(to_user_id=to_user_id).count()
+
+    @classmethod
+    def update_celebrity(cls, user_id, follower_count):
+        # returns whether the user is a celebrity now
+        threshold = settings.NEWSFEED_CELEBRITY_FOLLOWER_THRESHOLD
+        conn = RedisClient.get_connection()
+        if follower_count >= threshold:
+            pipeline = conn.pipeline()
+            pipeline.sadd(CELEBRITY_USER_IDS_KEY, user_id)
+            pipeline.hsetnx(CELEBRITY_SINCE_KEY, user_id, int(time.time()))
+            # promoted again while a demotion is backfilled, the backfill
+            # leaves the user a celebrity
+            pipeline.srem(DEMOTING_CELEBRITY_IDS_KEY, user_id)
+            pipeline.execute()
+            return True
+        if follower_count < threshold // 2:
+            # tweets posted as a celebrity were never fanned out, readers keep
+            # merging them until the backfill has written their newsfeeds
+            if conn.sismember(CELEBRITY_USER_IDS_KEY, user_id) and \
+                    conn.sadd(DEMOTING_CELEBRITY_IDS_KEY, user_id):
+                from newsfeeds.tasks import backfill_celebrity_newsfeeds_task
+                backfill_celebrity_newsfeeds_task.delay(user_id)
+            return False
+        # a demoting user is fanned out again, the backfill only covers the
+        # tweets posted before it started
+        pipeline = conn.pipeline(transaction=False)
+        pipeline.sismember(CELEBRITY_USER_IDS_KEY, user_id)
+        pipeline.sismember(DEMOTING_CELEBRITY_IDS_KEY, user_id)
+        is_celebrity, is_demoting = pipeline.execute()
+        return bool(is_celebrity) and not is_demoting
+
+    @classmethod
+    def get_celebrity_since(cls, user_id):
+        # None for celebrities promoted before the time was recorded
+        conn = RedisClient.get_connection()
+        since = conn.hget(CELEBRITY_SINCE_KEY, user_id)
+        return int(since) if since is not None else None
+
+    @classmethod
+    def finish_celebrity_demotion(cls, user_id):
+        # returns False if the user was promoted again meanwhile
+        conn = RedisClient.get_connection()
+        if not conn.srem(DEMOTING_CELEBRITY_IDS_KEY, user_id):
+            return False
+        pipeline = conn.pipeline()
+        pipeline.srem(CELEBRITY_USER_IDS_KEY, user_id)
+        pipeline.hdel(CELEBRITY_SINCE_KEY, user_id)
+        pipeline.execute()
+        return True
+
+    @classmethod
+    def get_followed_celebrity_ids(cls, user_id):
+        # most deployments have no celebrity, skip the following set then
+        conn = RedisClient.get_connection()
+        celebrity_ids = {
+            int(celebrity_id)
+            for celebrity_id in conn.smembers(CELEBRITY_USER_IDS_KEY)
+        }
+        if not celebrity_ids:
+            return []
+        return sorted(celebrity_ids & cls.get_following_user_id_set(user_id))
 
     @classmethod
     def get_following_user_id_set(cls, user_id):
         key = FOLLOWING_PATTERNS.format(user_id=user_id)
-        following_user_id_set = cache.get(key)
-        if following_user_id_set:
+        # an empty set is a hit too, MISSING tells the misses apart
+        following_user_id_set = cache.get(key, MISSING)
+        if following_user_id_set is not MISSING:
             return following_user_id_set
 
         friendships = Friendship.objects.filter(from_user_id=user_id)
@@ -1,6 +1,10 @@
+from django.test import override_settings
 from friendships.models import Friendship
 from friendships.services import FriendshipService
 from testing.testcases import TestCase
+from twitter.cache import DEMOTING_CELEBRITY_IDS_KEY
+from utils.redis.redis_client import RedisClient
+from utils.time_helpers import utc_now
 
 
 class FriendshipServiceTests(TestCase):
@@ -42,3 +46,99 @@ class FriendshipServiceTests(TestCase):
             user_id_set,
             set([self.user2.id, self.user3.id, user5.id]),
         )
+
+    def test_empty_following_user_id_set(self):
+        user4 = self.create_user('test_user4')
+        self.assertEqual(FriendshipService.get_following_user_id_set(user4.id), set())
+        # an empty set is cached as well
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipService.get_following_user_id_set(user4.id), set())
+
+        # no celebrity, no following set lookup
+        self.create_friendship(user4, self.user1)
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipService.get_followed_celebrity_ids(user4.id), [])
+
+    def test_iter_follower_id_chunks(self):
+        follower_ids = []
+        for i in range(5):
+            follower = self.create_user('follower{}'.format(i))
+            self.create_friendship(follower, self.user1)
+            follower_ids.append(follower.id)
+        self.create_friendship(self.user1, self.user2)
+
+        chunks = list(FriendshipService.iter_follower_id_chunks(self.user1.id, 2))
+        self.assertEqual(
+            [ids for _, ids in chunks],
+            [follower_ids[:2], follower_ids[2:4], follower_ids[4:]],
+        )
+        chunks = list(FriendshipService.iter_follower_id_chunks(self.user1.id, 5))
+        self.assertEqual([ids for _, ids in chunks], [follower_ids])
+        self.assertEqual(
+            [
+                ids
+                for _, ids in FriendshipService.iter_follower_id_chunks(
+                    self.user2.id,
+                    2,
+                )
+            ],
+            [[self.user1.id]],
+        )
+
+        # resume after the first chunk
+        cursor, _ = next(FriendshipService.iter_follower_id_chunks(self.user1.id, 2))
+        chunks = list(FriendshipService.iter_follower_id_chunks(
+            self.user1.id,
+            2,
+            after=cursor,
+        ))
+        self.assertEqual(
+            [ids for _, ids in chunks],
+            [follower_ids[2:4], follower_ids[4:]],
+        )
+
+        # followed at the same time, ties are broken by id
+        Friendship.objects.filter(to_user=self.user1).update(created_at=utc_now())
+        chunks = list(FriendshipService.iter_follower_id_chunks(self.user1.id, 2))
+        self.assertEqual(
+            [ids for _, ids in chunks],
+            [follower_ids[:2], follower_ids[2:4], follower_ids[4:]],
+        )
+        self.assertEqual(
+            set(FriendshipService.get_follower_ids(self.user1.id)),
+            set(follower_ids),
+        )
+
+    @override_settings(NEWSFEED_CELEBRITY_FOLLOWER_THRESHOLD=4)
+    def test_celebrity_demotion(self):
+        self.create_friendship(self.user2, self.user1)
+        self.assertEqual(FriendshipService.update_celebrity(self.user1.id, 4), True)
+        self.assertIsNotNone(FriendshipService.get_celebrity_since(self.user1.id))
+        self.assertEqual(
+            FriendshipService.get_followed_celebrity_ids(self.user2.id),
+            [self.user1.id],
+        )
+
+        # a backfill is running, the tweets are fanned out again but the
+        # followers keep merging the celebrity era tweets
+        conn = RedisClient.get_connection()
+        conn.sadd(DEMOTING_CELEBRITY_IDS_KEY, self.user1.id)
+        self.assertEqual(FriendshipService.update_celebrity(self.user1.id, 1), False)
+        self.assertEqual(FriendshipService.update_celebrity(self.user1.id, 3), False)
+        self.assertEqual(
+            FriendshipService.get_followed_celebrity_ids(self.user2.id),
+            [self.user1.id],
+        )
+        self.assertEqual(FriendshipService.finish_celebrity_demotion(self.user1.id), True)
+        self.assertEqual(FriendshipService.get_followed_celebrity_ids(self.user2.id), [])
+        self.assertIsNone(FriendshipService.get_celebrity_since(self.user1.id))
+
+        # promoted again during the backfill, the user stays a celebrity
+        FriendshipService.update_celebrity(self.user1.id, 4)
+        conn.sadd(DEMOTING_CELEBRITY_IDS_KEY, self.user1.id)
+        FriendshipService.update_celebrity(self.user1.id, 4)
+        self.assertEqual(FriendshipService.finish_celebrity_demotion(self.user1.id), False)
+        self.assertEqual(
+            FriendshipService.get_followed_celebrity_ids(self.user2.id),
+            [self.user1.id],
+        )
@@ -1,10 +1,67 @@
-from accounts.api.serializers import UserSerializerForLike
+from accounts.api.serializers import (
+    ListSerializerWithCachedUsers,
+    UserSerializerForLike,
+)
 from comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
+from django.db import models
 from likes.models import Like
+from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.models import Tweet
+from utils.redis.redis_helper import RedisHelper
+
+
+class ListSerializerWithLikes(ListSerializerWithCachedUsers):
+    # has_liked and the counters of the whole list are resolved in batch and
+    # kept in the serializer context, the objects may be shared with other
+    # requests
+    counter_attrs = ('likes_count',)
+
+    @classmethod
+    def attach_has_liked(cls, context, targets):
+        if not targets or 'request' not in context:
+            return
+        label = targets[0]._meta.label
+        has_liked_map = LikeService.get_has_liked_map(
+            context['request'].user,
+            targets,
+        )
+        context.setdefault('has_liked', {}).setdefault(label, {}).update(
+            has_liked_map,
+        )
+
+    @classmethod
+    def get_has_liked(cls, context, target):
+        has_liked_map = context.get('has_liked', {}).get(target._meta.label, {})
+        if target.id in has_liked_map:
+            return has_liked_map[target.id]
+        return LikeService.has_liked(context['request'].user, target)
+
+    @classmethod
+    def attach_counts(cls, context, objects, attrs):
+        if not objects:
+            return
+        label = objects[0]._meta.label
+        counts = context.setdefault('counts', {}).setdefault(label, {})
+        for object_id, object_counts in RedisHelper.get_counts(objects, attrs).items():
+            counts.setdefault(object_id, {}).update(object_counts)
+
+    @classmethod
+    def get_count(cls, context, obj, attr):
+        counts = context.get('counts', {}).get(obj._meta.label, {})
+        if attr in counts.get(obj.id, {}):
+            return counts[obj.id][attr]
+        return RedisHelper.get_count(obj, attr)
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        objects = list(data)
+        self.attach_has_liked(self.context, objects)
+        self.attach_counts(self.context, objects, self.counter_attrs)
+        return super().to_representation(objects)
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -13,6 +70,7 @@ class LikeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Like
         fields = ('user', 'created_at')
+        list_serializer_class = ListSerializerWithCachedUsers
 
 
 class BaseLikeSerializerForCreateAndCancel(serializers.ModelSerializer):
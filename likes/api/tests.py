@@ -1,3 +1,5 @@
+from django.contrib.auth.models import AnonymousUser
+from likes.services import LikeService
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 
@@ -338,3 +340,38 @@ class LikeApiTests(TestCase):
         self.assertEqual(response.data['results'][0]['tweet']['likes_count'], 0)
         tweet.refresh_from_db()
         self.assertEqual(tweet.likes_count, 0)
+
+    def test_has_liked_in_batch(self):
+        tweets = [self.create_tweet(self.user1) for _ in range(3)]
+        self.create_like(self.user2, tweets[0])
+        self.create_like(self.user2, tweets[2])
+        self.create_like(self.user1, tweets[1])
+        comment = self.create_comment(self.user1, tweets[0])
+        self.create_like(self.user2, comment)
+
+        has_liked_map = LikeService.get_has_liked_map(self.user2, tweets)
+        self.assertEqual(has_liked_map, {
+            tweets[0].id: True,
+            tweets[1].id: False,
+            tweets[2].id: True,
+        })
+        self.assertEqual(LikeService.get_has_liked_map(self.user2, []), {})
+        self.assertEqual(
+            LikeService.get_has_liked_map(AnonymousUser(), tweets),
+            {tweet.id: False for tweet in tweets},
+        )
+
+        response = self.user2_client.get(TWEET_LIST_URL, {'user_id': self.user1.id})
+        has_liked = {
+            tweet['id']: tweet['has_liked']
+            for tweet in response.data['results']
+        }
+        self.assertEqual(has_liked, has_liked_map)
+
+        # comments in the tweet detail are resolved separately from the tweet
+        response = self.user2_client.get(TWEET_DETAIL_URL.format(tweets[0].id))
+        self.assertEqual(response.data['has_liked'], True)
+        self.assertEqual(response.data['comments'][0]['has_liked'], True)
+        response = self.user1_client.get(TWEET_DETAIL_URL.format(tweets[0].id))
+        self.assertEqual(response.data['has_liked'], False)
+        self.assertEqual(response.data['comments'][0]['has_liked'], False)
@@ -1,35 +1,43 @@
 from django.db.models import F
+from utils.redis.redis_counters import RedisCounterHelper
 from utils.redis.redis_helper import RedisHelper
 
 
-def incr_likes_count(sender, instance, created, **kwargs):
+def _update_likes_count(instance, amount):
     from comments.models import Comment
     from tweets.models import Tweet
 
-    if not created:
-        return
-
     if instance.content_object.__class__.__name__ != 'Tweet':
-        Comment.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') + 1
+        model_class = Comment
+    else:
+        model_class = Tweet
+    if RedisCounterHelper.is_enabled():
+        RedisCounterHelper.add_delta(
+            model_class,
+            instance.object_id,
+            'likes_count',
+            amount,
         )
     else:
-        Tweet.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') + 1
+        model_class.objects.filter(id=instance.object_id).update(
+            likes_count=F('likes_count') + amount
         )
+
+
+def incr_likes_count(sender, instance, created, **kwargs):
+    from likes.services import LikeService
+
+    if not created:
+        return
+
+    _update_likes_count(instance, 1)
     RedisHelper.incr_count(instance.content_object, 'likes_count')
+    LikeService.add_to_liked_set(instance)
 
 
 def decr_likes_count(sender, instance, **kwargs):
-    from comments.models import Comment
-    from tweets.models import Tweet
+    from likes.services import LikeService
 
-    if instance.content_object.__class__.__name__ != 'Tweet':
-        Comment.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') - 1
-        )
-    else:
-        Tweet.objects.filter(id=instance.object_id).update(
-            likes_count=F('likes_count') - 1
-        )
+    _update_likes_count(instance, -1)
     RedisHelper.decr_count(instance.content_object, 'likes_count')
+    LikeService.remove_from_liked_set(instance)
@@ -33,6 +33,9 @@ class Like(models.Model):
 
     @property
     def cached_user(self):
+        # set by the batched hydration of a page
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemcachedHelper.get_object_through_cache(User, self.user_id)
 
 
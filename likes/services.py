@@ -1,16 +1,150 @@
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
 from likes.models import Like
+from twitter.cache import USER_LIKED_FILL_LOCK_PATTERN, USER_LIKED_PATTERN
+from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
+import uuid
+
+# every cached liked set holds one of these markers, so a user without likes
+# still has a key and a set over the size limit is known to be partial
+LIKED_SET_COMPLETE = 'complete'
+LIKED_SET_PARTIAL = 'partial'
 
 
 class LikeService:
 
+    @classmethod
+    def get_liked_set_key(cls, user_id, content_type):
+        return USER_LIKED_PATTERN.format(
+            user_id=user_id,
+            model=content_type.model,
+        )
+
+    @classmethod
+    def _load_liked_set(cls, key, user_id, content_type):
+        # filled under a token like the timelines: the set is built aside and
+        # only renamed into place if no like or unlike of the user marked
+        # the fill dirty since it read db. while another fill runs the
+        # answer comes from db without caching
+        conn = RedisClient.get_connection()
+        lock_key = USER_LIKED_FILL_LOCK_PATTERN.format(key=key)
+        token = uuid.uuid4().hex
+        is_filling = conn.set(lock_key, token, nx=True, ex=settings.REDIS_REBUILD_LOCK_TIME)
+
+        limit = settings.USER_LIKED_SET_SIZE_LIMIT
+        try:
+            liked_ids = list(
+                Like.objects.filter(user_id=user_id, content_type=content_type)
+                .order_by('-created_at')
+                .values_list('object_id', flat=True)[:limit + 1]
+            )
+        except Exception:
+            if is_filling:
+                RedisHelper.release_lock(lock_key, token)
+            raise
+        is_partial = len(liked_ids) > limit
+        liked_ids = liked_ids[:limit]
+        if not is_filling:
+            return set(liked_ids), is_partial
+
+        build_key = '{}:build:{}'.format(key, token)
+        pipeline = conn.pipeline()
+        pipeline.sadd(
+            build_key,
+            LIKED_SET_PARTIAL if is_partial else LIKED_SET_COMPLETE,
+            *liked_ids,
+        )
+        pipeline.expire(build_key, settings.USER_LIKED_SET_EXPIRE_TIME)
+        pipeline.execute()
+        RedisHelper.publish_build(lock_key, build_key, key, token)
+        return set(liked_ids), is_partial
+
+    @classmethod
+    def get_likes_counts(cls, model_class, object_ids):
+        # {object_id: likes count}, objects without likes are left out
+        return dict(
+            Like.objects.filter(
+                content_type=ContentType.objects.get_for_model(model_class),
+                object_id__in=object_ids,
+            ).values('object_id').annotate(
+                count=Count('id'),
+            ).values_list('object_id', 'count')
+        )
+
     @classmethod
     def has_liked(cls, user, target):
         if user.is_anonymous:
             return False
 
-        return Like.objects.filter(
-            object_id=target.id,
-            content_type=ContentType.objects.get_for_model(target.__class__),
-            user=user
-        ).exists()
+        return cls.get_has_liked_map(user, [target])[target.id]
+
+    @classmethod
+    def get_has_liked_map(cls, user, targets):
+        # {target.id: bool} for targets of one model, answered by the user's
+        # liked set in one round trip, db is only read to fill the set and
+        # for ids that are not in a partial set
+        target_ids = list({target.id for target in targets})
+        if user.is_anonymous or not target_ids:
+            return {target_id: False for target_id in target_ids}
+
+        content_type = ContentType.objects.get_for_model(targets[0].__class__)
+        key = cls.get_liked_set_key(user.id, content_type)
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline()
+        pipeline.exists(key)
+        pipeline.sismember(key, LIKED_SET_PARTIAL)
+        for target_id in target_ids:
+            pipeline.sismember(key, target_id)
+        exists, is_partial, *is_members = pipeline.execute()
+        if not exists:
+            liked_ids, is_partial = cls._load_liked_set(key, user.id, content_type)
+            is_members = [target_id in liked_ids for target_id in target_ids]
+
+        has_liked_map = {
+            target_id: bool(is_member)
+            for target_id, is_member in zip(target_ids, is_members)
+        }
+        unknown_ids = [
+            target_id
+            for target_id, liked in has_liked_map.items()
+            if not liked
+        ] if is_partial else []
+        if unknown_ids:
+            for object_id in Like.objects.filter(
+                object_id__in=unknown_ids,
+                content_type=content_type,
+                user=user,
+            ).values_list('object_id', flat=True):
+                has_liked_map[object_id] = True
+        return has_liked_map
+
+    @classmethod
+    def add_to_liked_set(cls, like):
+        # only a cached set is updated, a missing one is filled on read.
+        # SADD is idempotent, which matches the unique (user, target) likes
+        if like.user_id is None or like.content_type_id is None:
+            return
+        content_type = ContentType.objects.get_for_id(like.content_type_id)
+        key = cls.get_liked_set_key(like.user_id, content_type)
+        # before the set is touched, a fill published in between has read
+        # the like from db
+        RedisHelper.mark_build_dirty(USER_LIKED_FILL_LOCK_PATTERN.format(key=key))
+        RedisHelper.add_to_capped_set_if_exists(
+            key,
+            like.object_id,
+            settings.USER_LIKED_SET_SIZE_LIMIT + 1,
+            LIKED_SET_COMPLETE,
+            LIKED_SET_PARTIAL,
+        )
+
+    @classmethod
+    def remove_from_liked_set(cls, like):
+        if like.user_id is None or like.content_type_id is None:
+            return
+        content_type = ContentType.objects.get_for_id(like.content_type_id)
+        key = cls.get_liked_set_key(like.user_id, content_type)
+        RedisHelper.mark_build_dirty(USER_LIKED_FILL_LOCK_PATTERN.format(key=key))
+        conn = RedisClient.get_connection()
+        conn.srem(key, like.object_id)
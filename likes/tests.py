@@ -0,0 +1,113 @@
+from django.contrib.contenttypes.models import ContentType
+from likes.models import Like
+from likes.services import LIKED_SET_COMPLETE, LIKED_SET_PARTIAL, LikeService
+from testing.testcases import TestCase
+from tweets.models import Tweet
+from twitter.cache import USER_LIKED_FILL_LOCK_PATTERN
+from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
+
+
+class LikeServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user1 = self.create_user('user1')
+        self.user2 = self.create_user('user2')
+
+    def test_liked_set(self):
+        conn = RedisClient.get_connection()
+        content_type = ContentType.objects.get_for_model(Tweet)
+        key = LikeService.get_liked_set_key(self.user2.id, content_type)
+        tweets = [self.create_tweet(self.user1) for _ in range(3)]
+
+        # a like before the set is cached does not create it
+        self.create_like(self.user2, tweets[0])
+        self.assertEqual(conn.exists(key), 0)
+
+        # cold start fills the set, users without likes are cached too
+        self.assertEqual(LikeService.has_liked(self.user2, tweets[0]), True)
+        self.assertEqual(LikeService.has_liked(self.user2, tweets[1]), False)
+        self.assertEqual(conn.exists(key), 1)
+        self.assertEqual(LikeService.has_liked(self.user1, tweets[0]), False)
+        self.assertEqual(
+            conn.exists(LikeService.get_liked_set_key(self.user1.id, content_type)),
+            1,
+        )
+
+        # maintained by the like listeners once cached
+        self.create_like(self.user2, tweets[1])
+        self.create_like(self.user2, tweets[1])
+        self.assertEqual(conn.sismember(key, tweets[1].id), True)
+        Like.objects.filter(user=self.user2, object_id=tweets[0].id).delete()
+        self.assertEqual(conn.sismember(key, tweets[0].id), False)
+        self.assertEqual(
+            LikeService.get_has_liked_map(self.user2, tweets),
+            {tweets[0].id: False, tweets[1].id: True, tweets[2].id: False},
+        )
+
+        # expired set is filled again from db
+        conn.delete(key)
+        self.assertEqual(LikeService.has_liked(self.user2, tweets[1]), True)
+
+    def test_partial_liked_set(self):
+        conn = RedisClient.get_connection()
+        content_type = ContentType.objects.get_for_model(Tweet)
+        key = LikeService.get_liked_set_key(self.user2.id, content_type)
+        # USER_LIKED_SET_SIZE_LIMIT is 5 in testing
+        tweets = [self.create_tweet(self.user1) for _ in range(7)]
+        for tweet in tweets[:6]:
+            self.create_like(self.user2, tweet)
+
+        has_liked_map = LikeService.get_has_liked_map(self.user2, tweets)
+        self.assertEqual(has_liked_map[tweets[0].id], True)
+        self.assertEqual(has_liked_map[tweets[6].id], False)
+        self.assertEqual(conn.sismember(key, LIKED_SET_PARTIAL), True)
+        self.assertEqual(conn.scard(key), 6)
+        # ids missing from a partial set are checked in db
+        self.assertEqual(LikeService.has_liked(self.user2, tweets[0]), True)
+
+        # a full partial set is not grown, the new like is checked in db
+        self.create_like(self.user2, tweets[6])
+        self.assertEqual(conn.scard(key), 6)
+        self.assertEqual(conn.sismember(key, tweets[6].id), False)
+        self.assertEqual(LikeService.has_liked(self.user2, tweets[6]), True)
+
+        # a full complete set turns partial instead of being dropped
+        user3 = self.create_user('user3')
+        key = LikeService.get_liked_set_key(user3.id, content_type)
+        for tweet in tweets[:5]:
+            self.create_like(user3, tweet)
+        self.assertEqual(LikeService.has_liked(user3, tweets[0]), True)
+        self.assertEqual(conn.sismember(key, LIKED_SET_COMPLETE), True)
+        self.create_like(user3, tweets[5])
+        self.assertEqual(conn.scard(key), 6)
+        self.assertEqual(conn.sismember(key, LIKED_SET_COMPLETE), False)
+        self.assertEqual(conn.sismember(key, LIKED_SET_PARTIAL), True)
+        self.assertEqual(LikeService.has_liked(user3, tweets[5]), True)
+
+    def test_liked_set_fill_races_with_unlike(self):
+        conn = RedisClient.get_connection()
+        content_type = ContentType.objects.get_for_model(Tweet)
+        key = LikeService.get_liked_set_key(self.user2.id, content_type)
+        lock_key = USER_LIKED_FILL_LOCK_PATTERN.format(key=key)
+        tweet = self.create_tweet(self.user1)
+        like = self.create_like(self.user2, tweet)
+
+        # another fill has read the like from db and not published yet,
+        # meanwhile reads are answered from db without caching
+        conn.set(lock_key, 'token')
+        conn.sadd('test_build', LIKED_SET_COMPLETE, tweet.id)
+        self.assertEqual(LikeService.has_liked(self.user2, tweet), True)
+        self.assertEqual(conn.exists(key), 0)
+
+        # the unlike marks the fill dirty, its stale set is discarded
+        like.delete()
+        published = RedisHelper.publish_build(lock_key, 'test_build', key, 'token')
+        self.assertEqual(published, 0)
+        self.assertEqual(conn.exists(key, 'test_build', lock_key), 0)
+
+        # the next read fills the set from db
+        self.assertEqual(LikeService.has_liked(self.user2, tweet), False)
+        self.assertEqual(conn.exists(key), 1)
+        self.assertEqual(conn.sismember(key, tweet.id), False)
@@ -1,6 +1,26 @@
 from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
 from rest_framework import serializers
-from tweets.api.serializers import TweetSerializer
+from tweets.api.serializers import TweetListSerializer, TweetSerializer
+
+
+class NewsFeedListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        newsfeeds = NewsFeedService.hydrate_newsfeeds(list(data))
+        tweets = [
+            newsfeed._cached_tweet
+            for newsfeed in newsfeeds
+            if hasattr(newsfeed, '_cached_tweet')
+        ]
+        TweetListSerializer.attach_has_liked(self.context, tweets)
+        TweetListSerializer.attach_photo_urls(self.context, tweets)
+        TweetListSerializer.attach_counts(
+            self.context,
+            tweets,
+            TweetListSerializer.counter_attrs,
+        )
+        return super().to_representation(newsfeeds)
 
 
 class NewsFeedSerializer(serializers.ModelSerializer):
@@ -9,3 +29,4 @@ class NewsFeedSerializer(serializers.ModelSerializer):
     class Meta:
         model = NewsFeed
         fields = ('id', 'created_at', 'tweet')
+        list_serializer_class = NewsFeedListSerializer
@@ -1,8 +1,10 @@
 from django.conf import settings
+from django.test import override_settings
 from newsfeeds.models import NewsFeed
 from newsfeeds.services import NewsFeedService
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from tweets.models import Tweet
 from utils.paginations.endless_paginations import EndlessPagination
 
 NEWSFEEDS_URL = '/api/newsfeeds/'
@@ -224,3 +226,100 @@ class NewsFeedApiTests(TestCase):
         _test_newsfeeds_after_new_feed_pushed()
         self.clear_cache()
         _test_newsfeeds_after_new_feed_pushed()
+
+    @override_settings(NEWSFEED_CELEBRITY_FOLLOWER_THRESHOLD=2)
+    def test_celebrity_tweets_merged_on_read(self):
+        page_size = EndlessPagination.page_size
+        user3 = self.create_user('test_user3')
+        self.create_friendship(self.user1, self.user2)
+        self.create_friendship(user3, self.user2)
+        # fanned out before user2 became a celebrity
+        tweet = self.create_tweet(self.user2)
+        self.create_newsfeed(self.user1, tweet)
+
+        # user2 has 2 followers, tweets are no longer fanned out
+        for _ in range(page_size // 2):
+            self.user2_client.post(POST_TWEETS_URL, {'content': 'celebrity'})
+            self.user1_client.post(POST_TWEETS_URL, {'content': 'own tweet'})
+        self.assertEqual(
+            NewsFeed.objects.filter(user=self.user1, tweet__user=self.user2).count(),
+            1,
+        )
+        self.assertEqual(NewsFeed.objects.filter(user=user3).count(), 0)
+
+        expected = [
+            tweet.id
+            for tweet in Tweet.objects.filter(
+                user__in=[self.user1, self.user2],
+            ).order_by('-created_at')
+        ]
+        response = self.user1_client.get(NEWSFEEDS_URL)
+        self.assertEqual(response.data['has_next_page'], True)
+        results = response.data['results']
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            expected[:page_size],
+        )
+        response = self.user1_client.get(NEWSFEEDS_URL, {
+            'created_at__lt': results[-1]['created_at'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        # the fanned out tweet is not duplicated
+        self.assertEqual(
+            [result['tweet']['id'] for result in response.data['results']],
+            expected[page_size:],
+        )
+
+        # followers of the celebrity see the tweets without any newsfeed row
+        client = APIClient()
+        client.force_authenticate(user3)
+        response = client.get(NEWSFEEDS_URL, {
+            'created_at__gt': results[3]['created_at'],
+        })
+        self.assertEqual(
+            [result['tweet']['id'] for result in response.data['results']],
+            [results[1]['tweet']['id']],
+        )
+
+    @override_settings(NEWSFEED_CELEBRITY_FOLLOWER_THRESHOLD=2)
+    def test_merged_newsfeeds_paginate_across_pages(self):
+        page_size = EndlessPagination.page_size
+        user3 = self.create_user('test_user3')
+        self.create_friendship(self.user1, self.user2)
+        self.create_friendship(user3, self.user2)
+        old_tweet = self.create_tweet(self.user2)
+        for _ in range(page_size - 1):
+            self.user1_client.post(POST_TWEETS_URL, {'content': 'own tweet'})
+        self.user2_client.post(POST_TWEETS_URL, {'content': 'celebrity'})
+        new_tweet = Tweet.objects.filter(user=self.user2).order_by('-created_at').first()
+        # a late newsfeed of the old tweet sorts first, the merged tweet
+        # would have landed on the next page
+        newsfeed = self.create_newsfeed(self.user1, old_tweet)
+
+        response = self.user1_client.get(NEWSFEEDS_URL)
+        self.assertEqual(response.data['has_next_page'], True)
+        results = response.data['results']
+        self.assertEqual(len(results), page_size)
+        self.assertEqual(results[0]['id'], newsfeed.id)
+        self.assertEqual(results[0]['tweet']['id'], old_tweet.id)
+        # merged tweets get a stable id
+        self.assertEqual(results[1]['id'], -new_tweet.id)
+        self.assertEqual(results[1]['tweet']['id'], new_tweet.id)
+
+        response = self.user1_client.get(NEWSFEEDS_URL, {
+            'created_at__lt': results[-1]['created_at'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        results += response.data['results']
+        tweet_ids = [result['tweet']['id'] for result in results]
+        self.assertEqual(len(tweet_ids), page_size + 1)
+        self.assertEqual(len(set(tweet_ids)), page_size + 1)
+        self.assertEqual(len({result['id'] for result in results}), page_size + 1)
+        self.assertNotIn(None, [result['id'] for result in results])
+
+        # the merged page is the same when read again
+        response = self.user1_client.get(NEWSFEEDS_URL)
+        self.assertEqual(
+            [result['id'] for result in response.data['results']],
+            [result['id'] for result in results[:page_size]],
+        )
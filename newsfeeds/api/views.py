@@ -1,3 +1,4 @@
+from accounts.services import UserService
 from django.utils.decorators import method_decorator
 from newsfeeds.api.serializers import NewsFeedSerializer
 from newsfeeds.models import NewsFeed
@@ -15,11 +16,16 @@ class NewsFeedViewSet(viewsets.GenericViewSet):
 
     @method_decorator(ratelimit(key='user', rate='5/s', method='GET', block=True))
     def list(self, request):
-        newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(request.user.id)
-        page = self.paginator.get_paginated_cached_list_in_redis(newsfeeds, request)
-        if not page:
-            newsfeeds = NewsFeed.objects.filter(user_id=request.user.id).order_by('-created_at')
-            page = self.paginate_queryset(newsfeeds)
+        UserService.mark_active(request.user.id)
+        timelines = NewsFeedService.get_newsfeed_timelines(request.user.id)
+        if len(timelines) > 1:
+            page = self.paginator.paginate_merged_timelines(timelines, request)
+            page = NewsFeedService.merge_tweets_into_newsfeeds(request.user.id, page)
+        else:
+            newsfeeds, queryset = timelines[0]
+            page = self.paginator.get_paginated_cached_list_in_redis(newsfeeds, request)
+            if page is None:
+                page = self.paginate_queryset(queryset)
         serializer = NewsFeedSerializer(
             page,
             context={'request': request},
@@ -1,3 +1,9 @@
 from django.conf import settings
 
 FANOUT_BATCH_SIZE = 100 if not settings.TESTING else 3
+# followers are read in chunks of whole batches
+FANOUT_READ_CHUNK_BATCHES = 10
+FANOUT_READ_CHUNK_SIZE = FANOUT_BATCH_SIZE * FANOUT_READ_CHUNK_BATCHES
+# transient db/redis errors are retried with exponential backoff
+FANOUT_MAX_RETRIES = 5
+FANOUT_RETRY_BACKOFF_MAX = 10 * 60  # in seconds
@@ -0,0 +1,228 @@
+from celery import current_app
+from celery.signals import task_postrun, task_prerun
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from friendships.models import Friendship
+from newsfeeds import tasks
+from newsfeeds.constants import FANOUT_BATCH_SIZE
+from newsfeeds.models import NewsFeed
+from tweets.models import Tweet
+from twitter.cache import CELEBRITY_USER_IDS_KEY, USER_ACTIVITY_KEY
+from utils.redis.redis_client import RedisClient
+import resource
+import time
+import uuid
+
+SEED_BATCH_SIZE = 5000
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)  # in ms
+
+
+class Command(BaseCommand):
+    help = 'Seed an author with synthetic followers and measure the newsfeed fanout of one tweet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, default=10000)
+        parser.add_argument(
+            '--active-ratio',
+            type=float,
+            default=0.1,
+            help='share of the followers marked active, they go to the priority lane',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='overrides FANOUT_BATCH_SIZE, passed to the fanout task',
+        )
+        parser.add_argument(
+            '--eager',
+            action='store_true',
+            help=(
+                'run the batches in this process instead of on a local worker. '
+                'batch latencies are timed by task signals in this process, so '
+                'they are only reported with --eager'
+            ),
+        )
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=30 * 60,
+            help='seconds to wait for the worker to finish the batches',
+        )
+        parser.add_argument('--keep', action='store_true', help='keep the seeded data')
+
+    def handle(self, *args, **options):
+        conn = RedisClient.get_connection()
+        prefix = 'fanout_benchmark_{}'.format(uuid.uuid4().hex[:8])
+        self.stdout.write('seeding {} followers as {}_*'.format(options['followers'], prefix))
+        start = time.perf_counter()
+        author, follower_ids = self._seed(conn, prefix, options['followers'], options['active_ratio'])
+        self.stdout.write('seeded in {:.1f}s'.format(time.perf_counter() - start))
+
+        tweet = Tweet.objects.create(user=author, content='benchmark tweet')
+        try:
+            self._run(conn, tweet, len(follower_ids), options)
+        finally:
+            if not options['keep']:
+                self._cleanup(conn, author, follower_ids, tweet)
+
+    def _seed(self, conn, prefix, followers, active_ratio):
+        author = User.objects.create(username='{}_author'.format(prefix), password='!')
+        follower_ids = []
+        for index in range(0, followers, SEED_BATCH_SIZE):
+            usernames = [
+                '{}_{}'.format(prefix, i)
+                for i in range(index, min(index + SEED_BATCH_SIZE, followers))
+            ]
+            # bulk_create does not return ids on mysql, read them back
+            User.objects.bulk_create([
+                User(username=username, password='!') for username in usernames
+            ])
+            user_ids = list(
+                User.objects.filter(username__in=usernames).values_list('id', flat=True)
+            )
+            Friendship.objects.bulk_create([
+                Friendship(from_user_id=user_id, to_user_id=author.id)
+                for user_id in user_ids
+            ])
+            follower_ids.extend(user_ids)
+
+        active_count = int(len(follower_ids) * active_ratio)
+        now = int(time.time())
+        for index in range(0, active_count, SEED_BATCH_SIZE):
+            conn.zadd(USER_ACTIVITY_KEY, {
+                user_id: now
+                for user_id in follower_ids[index: min(index + SEED_BATCH_SIZE, active_count)]
+            })
+        return author, follower_ids
+
+    def _run(self, conn, tweet, followers, options):
+        # the main task always runs here, so the celebrity threshold can be
+        # lifted for it. the batches either run inline or go to the worker
+        latencies = []
+        started_at = {}
+
+        def on_prerun(task_id, task, **kwargs):
+            if task.name == tasks.fanout_newsfeeds_batch_task.name:
+                started_at[task_id] = time.perf_counter()
+
+        def on_postrun(task_id, task, **kwargs):
+            if task_id in started_at:
+                latencies.append((time.perf_counter() - started_at.pop(task_id)) * 1000)
+
+        task_prerun.connect(on_prerun, weak=False)
+        task_postrun.connect(on_postrun, weak=False)
+        always_eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = options['eager']
+        # the peak rss is measured from here, after seeding
+        rss_baseline = self._get_rss_baseline(options['eager'])
+
+        commands_processed = self._get_commands_processed(conn)
+        start = time.perf_counter()
+        try:
+            with override_settings(NEWSFEED_CELEBRITY_FOLLOWER_THRESHOLD=followers + 1):
+                result = tasks.fanout_newsfeeds_main_task.apply(
+                    args=(tweet.id, tweet.user_id),
+                    kwargs={'batch_size': options['batch_size']},
+                )
+            dispatched = time.perf_counter()
+            self.stdout.write(str(result.get()))
+            if not options['eager']:
+                self._wait_for_worker(tweet, followers + 1, options['timeout'])
+        finally:
+            task_prerun.disconnect(on_prerun)
+            task_postrun.disconnect(on_postrun)
+            current_app.conf.task_always_eager = always_eager
+        elapsed = time.perf_counter() - start
+        commands_processed = self._get_commands_processed(conn) - commands_processed
+
+        rows = NewsFeed.objects.filter(tweet_id=tweet.id).count()
+        self.stdout.write('batch size     {}'.format(options['batch_size'] or FANOUT_BATCH_SIZE))
+        self.stdout.write('rows           {}'.format(rows))
+        self.stdout.write('dispatch       {:.2f}s'.format(dispatched - start))
+        self.stdout.write('total          {:.2f}s'.format(elapsed))
+        self.stdout.write('rows/s         {:.0f}'.format(rows / elapsed))
+        # server wide, a worker on the same redis also counts broker commands
+        self.stdout.write('redis ops/s    {:.0f}'.format(commands_processed / elapsed))
+        self.stdout.write('peak rss       {}'.format(
+            self._format_rss(self._get_peak_rss(options['eager']), rss_baseline),
+        ))
+        if latencies:
+            self._write_histogram(latencies)
+        else:
+            self.stdout.write('batch latencies are only measured with --eager')
+
+    def _wait_for_worker(self, tweet, rows, timeout):
+        deadline = time.perf_counter() + timeout
+        while NewsFeed.objects.filter(tweet_id=tweet.id).count() < rows:
+            if time.perf_counter() > deadline:
+                raise CommandError('the worker did not finish in {}s'.format(timeout))
+            time.sleep(0.2)
+
+    def _get_commands_processed(self, conn):
+        return conn.info('stats')['total_commands_processed']
+
+    def _get_rss_baseline(self, eager):
+        # the peak of this process would include the seeding, linux resets
+        # it to the current rss through clear_refs. elsewhere the baseline is
+        # left out
+        if eager:
+            try:
+                with open('/proc/self/clear_refs', 'w') as clear_refs:
+                    clear_refs.write('5')
+            except OSError:
+                return {}
+        return self._get_peak_rss(eager)
+
+    def _get_peak_rss(self, eager):
+        # {process: peak rss in MB}, ru_maxrss is in kilobytes on linux
+        if eager:
+            return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+        stats = current_app.control.inspect().stats() or {}
+        return {
+            worker: worker_stats['rusage']['maxrss'] / 1024
+            for worker, worker_stats in stats.items()
+        }
+
+    def _format_rss(self, peak_rss, rss_baseline):
+        values = []
+        for process, rss in peak_rss.items():
+            value = '{} {:.1f}MB'.format(process, rss)
+            if process in rss_baseline:
+                value += ' (from {:.1f}MB)'.format(rss_baseline[process])
+            values.append(value)
+        return ', '.join(values) or 'no worker replied'
+
+    def _write_histogram(self, latencies):
+        latencies.sort()
+        self.stdout.write('batches        {}'.format(len(latencies)))
+        for percentile in (50, 90, 99):
+            index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+            self.stdout.write('p{:<13} {:.1f}ms'.format(percentile, latencies[index]))
+        self.stdout.write('max            {:.1f}ms'.format(latencies[-1]))
+        lower = 0
+        for upper in HISTOGRAM_BUCKETS + (None,):
+            count = sum(
+                1 for latency in latencies
+                if latency >= lower and (upper is None or latency < upper)
+            )
+            if count:
+                label = '{}-{}ms'.format(lower, upper) if upper else '>={}ms'.format(lower)
+                self.stdout.write('{:>14} {:6} {}'.format(
+                    label,
+                    count,
+                    '#' * max(1, count * 50 // len(latencies)),
+                ))
+            lower = upper
+
+    def _cleanup(self, conn, author, follower_ids, tweet):
+        NewsFeed.objects.filter(tweet_id=tweet.id).delete()
+        tweet.delete()
+        Friendship.objects.filter(to_user_id=author.id).delete()
+        for index in range(0, len(follower_ids), SEED_BATCH_SIZE):
+            batch_ids = follower_ids[index: index + SEED_BATCH_SIZE]
+            User.objects.filter(id__in=batch_ids).delete()
+            conn.zrem(USER_ACTIVITY_KEY, *batch_ids)
+        author.delete()
+        conn.srem(CELEBRITY_USER_IDS_KEY, author.id)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from newsfeeds.models import NewsFeed
+from tweets.models import Tweet
+from utils.redis.redis_serializers import DjangoModelSerializer
+from utils.time_helpers import utc_now
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare bytes per entry and decode time of the redis serializer formats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=200)
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def _build_objects(self, entries):
+        now = utc_now()
+        objects = []
+        for i in range(1, entries + 1):
+            objects.append(NewsFeed(id=i, user_id=1, tweet_id=i, created_at=now))
+            objects.append(Tweet(
+                id=i,
+                user_id=i % 100 + 1,
+                content='any content {}'.format(i),
+                created_at=now,
+                likes_count=i,
+                comments_count=i,
+            ))
+        return objects
+
+    def handle(self, *args, **options):
+        objects = self._build_objects(options['entries'])
+        rounds = options['rounds']
+        for format in ('json', 'compact'):
+            for model_class in (NewsFeed, Tweet):
+                serialized_list = [
+                    DjangoModelSerializer.serialize(obj, format=format)
+                    for obj in objects
+                    if isinstance(obj, model_class)
+                ]
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    for serialized_data in serialized_list:
+                        DjangoModelSerializer.deserialize(serialized_data)
+                elapsed = time.perf_counter() - start
+
+                self.stdout.write('{:8} {:9} {:7.1f} bytes/entry {:8.2f} us/decode'.format(
+                    format,
+                    model_class.__name__,
+                    sum(len(data) for data in serialized_list) / len(serialized_list),
+                    elapsed * 1e6 / (rounds * len(serialized_list)),
+                ))
@@ -20,6 +20,9 @@ class NewsFeed(models.Model):
         return '{} inbox of {}: {}'.format(self.created_at, self.user, self.tweet)
 
     def cached_tweet(self):
+        # set by NewsFeedService.hydrate_newsfeeds
+        if hasattr(self, '_cached_tweet'):
+            return self._cached_tweet
         return MemcachedHelper.get_object_through_cache(Tweet, self.tweet_id)
 
 
@@ -1,7 +1,19 @@
+from accounts.services import UserService
+from datetime import datetime, timedelta
+from django.conf import settings
+from friendships.services import FriendshipService
+from newsfeeds.constants import FANOUT_READ_CHUNK_SIZE
 from newsfeeds.models import NewsFeed
 from newsfeeds.tasks import fanout_newsfeeds_main_task
-from twitter.cache import USER_NEWSFEEDS_PATTERN
+from tweets.models import Tweet
+from tweets.services import TweetService
+from twitter.cache import USER_ACTIVITY_KEY, USER_NEWSFEEDS_PATTERN
+from utils.memcached.memcached_helper import MemcachedHelper
+from utils.redis.redis_client import RedisClient
 from utils.redis.redis_helper import RedisHelper
+from utils.time_constants import ONE_HOUR
+import pytz
+import time
 
 
 class NewsFeedService:
@@ -14,10 +26,138 @@ class NewsFeedService:
     def get_cached_newsfeeds_from_redis(cls, user_id):
         queryset = NewsFeed.objects.filter(user_id=user_id).order_by('-created_at')
         key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
-        return RedisHelper.load_objects(key, queryset)
+        return RedisHelper.get_timeline_helper('user_newsfeeds').load_objects(key, queryset)
+
+    @classmethod
+    def warm_cached_newsfeeds(cls):
+        # newsfeeds of the most recently active users are rebuilt or kept
+        # alive before they expire, so their next read is not a cold miss
+        since = int(time.time()) - settings.NEWSFEED_WARM_ACTIVE_WINDOW
+        conn = RedisClient.get_connection()
+        user_ids = conn.zrevrangebyscore(
+            USER_ACTIVITY_KEY,
+            '+inf',
+            since,
+            start=0,
+            num=settings.NEWSFEED_WARM_MAX_USERS,
+        )
+        return RedisHelper.get_timeline_helper('user_newsfeeds').warm_objects(
+            [(
+                USER_NEWSFEEDS_PATTERN.format(user_id=int(user_id)),
+                NewsFeed.objects.filter(user_id=int(user_id)).order_by('-created_at'),
+            ) for user_id in user_ids],
+            settings.NEWSFEED_WARM_TTL_THRESHOLD,
+        )
+
+    @classmethod
+    def get_newsfeed_timelines(cls, user_id):
+        # [(cached_list, queryset)] of the newsfeeds of the user and the
+        # tweets of the followed celebrities, which are not fanned out
+        timelines = [(
+            cls.get_cached_newsfeeds_from_redis(user_id),
+            NewsFeed.objects.filter(user_id=user_id).order_by('-created_at'),
+        )]
+        for celebrity_id in FriendshipService.get_followed_celebrity_ids(user_id):
+            timelines.append((
+                TweetService.get_cached_tweets_from_redis(celebrity_id),
+                Tweet.objects.filter(user_id=celebrity_id).order_by('-created_at'),
+            ))
+        return timelines
+
+    @classmethod
+    def merge_tweets_into_newsfeeds(cls, user_id, objects):
+        # tweets of celebrities become unsaved newsfeeds, their id is the
+        # negated tweet id so that it is stable and never clashes with a
+        # saved newsfeed. a tweet the user has a newsfeed of, fanned out
+        # before its author became a celebrity or backfilled after the
+        # demotion, is left to that newsfeed wherever it is paginated
+        tweet_ids = [obj.id for obj in objects if isinstance(obj, Tweet)]
+        if not tweet_ids:
+            return objects
+        fanned_out_tweet_ids = set(
+            NewsFeed.objects.filter(user_id=user_id, tweet_id__in=tweet_ids)
+            .values_list('tweet_id', flat=True)
+        )
+        newsfeeds = []
+        for obj in objects:
+            if isinstance(obj, Tweet):
+                if obj.id in fanned_out_tweet_ids:
+                    continue
+                newsfeed = NewsFeed(
+                    id=-obj.id,
+                    user_id=user_id,
+                    tweet_id=obj.id,
+                    created_at=obj.created_at,
+                )
+                newsfeed._cached_tweet = obj
+                obj = newsfeed
+            newsfeeds.append(obj)
+        return newsfeeds
+
+    @classmethod
+    def backfill_celebrity_newsfeeds(cls, user_id):
+        # newsfeeds of the tweets a demoted celebrity posted while not fanned
+        # out, dated like the tweets so they sort where the merged tweets
+        # were. returns the number of tweets
+        tweets = Tweet.objects.filter(user_id=user_id)
+        since = FriendshipService.get_celebrity_since(user_id)
+        if since is not None:
+            # the first skipped tweet was posted before its fanout task ran.
+            # without a recorded time all tweets are backfilled, rows that
+            # exist are skipped
+            since = datetime.fromtimestamp(since, tz=pytz.utc) - timedelta(seconds=ONE_HOUR)
+            tweets = tweets.filter(created_at__gte=since)
+        tweets = list(tweets.values_list('id', 'created_at'))
+        if tweets:
+            helper = RedisHelper.get_timeline_helper('user_newsfeeds')
+            for _, follower_ids in FriendshipService.iter_follower_id_chunks(
+                user_id,
+                FANOUT_READ_CHUNK_SIZE,
+            ):
+                for tweet_id, created_at in tweets:
+                    NewsFeed.objects.bulk_create([
+                        NewsFeed(user_id=follower_id, tweet_id=tweet_id)
+                        for follower_id in follower_ids
+                    ], ignore_conflicts=True)
+                    # auto_now_add is applied by bulk_create
+                    NewsFeed.objects.filter(
+                        tweet_id=tweet_id,
+                        user_id__in=follower_ids,
+                    ).update(created_at=created_at)
+                # the backfilled newsfeeds are older than the heads of the
+                # cached timelines, they are rebuilt instead of pushed to
+                helper.invalidate_objects([
+                    USER_NEWSFEEDS_PATTERN.format(user_id=follower_id)
+                    for follower_id in follower_ids
+                ])
+        FriendshipService.finish_celebrity_demotion(user_id)
+        return len(tweets)
 
     @classmethod
     def push_newsfeeds_to_redis(cls, newsfeed):
         queryset = NewsFeed.objects.filter(user_id=newsfeed.user_id).order_by('-created_at')
         key = USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id)
-        RedisHelper.push_object(key, newsfeed, queryset)
+        RedisHelper.get_timeline_helper('user_newsfeeds').push_object(key, newsfeed, queryset)
+
+    @classmethod
+    def push_newsfeeds_to_cached_timelines(cls, newsfeeds):
+        # one pipeline for a whole fanout batch, timelines that are not
+        # cached are skipped, they are loaded from db on the next read
+        return RedisHelper.get_timeline_helper('user_newsfeeds').push_objects_if_cached([
+            (USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id), newsfeed)
+            for newsfeed in newsfeeds
+        ])
+
+    @classmethod
+    def hydrate_newsfeeds(cls, newsfeeds):
+        # resolve the tweets and their users of a whole page with one
+        # get_many per model instead of one memcached get per object
+        tweets = MemcachedHelper.get_objects_through_cache(
+            Tweet,
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+        )
+        UserService.attach_cached_users(list(tweets.values()))
+        for newsfeed in newsfeeds:
+            if newsfeed.tweet_id in tweets:
+                newsfeed._cached_tweet = tweets[newsfeed.tweet_id]
+        return newsfeeds
@@ -1,36 +1,150 @@
+from accounts.services import UserService
 from celery import shared_task
+from django.db import InterfaceError, OperationalError
 from friendships.services import FriendshipService
-from newsfeeds.constants import FANOUT_BATCH_SIZE
+from newsfeeds.constants import (
+    FANOUT_BATCH_SIZE,
+    FANOUT_MAX_RETRIES,
+    FANOUT_READ_CHUNK_BATCHES,
+    FANOUT_RETRY_BACKOFF_MAX,
+)
 from newsfeeds.models import NewsFeed
+from redis.exceptions import ConnectionError, TimeoutError
+from twitter.cache import FANOUT_CHECKPOINT_PATTERN
+from utils.redis.redis_client import RedisClient
 from utils.time_constants import ONE_HOUR
+import time
 
+TRANSIENT_ERRORS = (InterfaceError, OperationalError, ConnectionError, TimeoutError)
 
-@shared_task(limit=ONE_HOUR, routing_key='default')
-def fanout_newsfeeds_main_task(tweet_id, tweet_user_id):
-    NewsFeed.objects.create(user_id=tweet_user_id, tweet_id=tweet_id)
-    follower_ids = FriendshipService.get_follower_ids(tweet_user_id)
-    index = 0
-    while index < len(follower_ids):
-        user_ids = follower_ids[index: index + FANOUT_BATCH_SIZE]
-        fanout_newsfeeds_batch_task.delay(tweet_id, user_ids)
-        index += FANOUT_BATCH_SIZE
+
+@shared_task(
+    bind=True,
+    limit=ONE_HOUR,
+    routing_key='default',
+    autoretry_for=TRANSIENT_ERRORS,
+    max_retries=FANOUT_MAX_RETRIES,
+    retry_backoff=True,
+    retry_backoff_max=FANOUT_RETRY_BACKOFF_MAX,
+)
+def fanout_newsfeeds_main_task(self, tweet_id, tweet_user_id, batch_size=None):
+    # batch_size overrides FANOUT_BATCH_SIZE, e.g. for benchmarks
+    batch_size = batch_size or FANOUT_BATCH_SIZE
+    NewsFeed.objects.get_or_create(user_id=tweet_user_id, tweet_id=tweet_id)
+    follower_count = FriendshipService.get_follower_count(tweet_user_id)
+    if FriendshipService.update_celebrity(tweet_user_id, follower_count):
+        # followers merge the tweets of celebrities into their newsfeeds
+        return '{} followers, fanout is skipped for a celebrity'.format(
+            follower_count,
+        )
+
+    # batches are enqueued while the followers are streamed. the cursor of
+    # the last enqueued friendship is kept as a checkpoint, a retried or
+    # re-sent task resumes from there, batches are idempotent so a chunk
+    # enqueued twice is harmless
+    conn = RedisClient.get_connection()
+    checkpoint_key = FANOUT_CHECKPOINT_PATTERN.format(tweet_id=tweet_id)
+    checkpoint = conn.get(checkpoint_key)
+    if checkpoint and b'|' not in checkpoint:
+        # a friendship id from before the cursor, started over
+        checkpoint = None
+    fanned_out = active = batches = 0
+    for cursor, follower_ids in FriendshipService.iter_follower_id_chunks(
+        tweet_user_id,
+        batch_size * FANOUT_READ_CHUNK_BATCHES,
+        after=checkpoint.decode() if checkpoint else None,
+    ):
+        # active followers go first through the priority queue, dormant
+        # ones wait in the newsfeeds queue
+        active_user_ids = UserService.get_active_user_ids(follower_ids)
+        lanes = (
+            ('newsfeeds_priority', [
+                user_id for user_id in follower_ids if user_id in active_user_ids
+            ]),
+            ('newsfeeds', [
+                user_id for user_id in follower_ids if user_id not in active_user_ids
+            ]),
+        )
+        for routing_key, user_ids in lanes:
+            for index in range(0, len(user_ids), batch_size):
+                fanout_newsfeeds_batch_task.apply_async(
+                    args=(tweet_id, user_ids[index: index + batch_size]),
+                    routing_key=routing_key,
+                )
+                batches += 1
+        active += len(lanes[0][1])
+        fanned_out += len(follower_ids)
+        conn.set(checkpoint_key, cursor, ex=ONE_HOUR)
+        if self.request.id:
+            self.update_state(state='PROGRESS', meta={
+                'followers': follower_count,
+                'fanned_out': fanned_out,
+                'active': active,
+                'batches': batches,
+            })
+    conn.delete(checkpoint_key)
 
     return '{} newsfeeds will be fanned out, {} batches are created'.format(
-        len(follower_ids),
-        (len(follower_ids) - 1) // FANOUT_BATCH_SIZE + 1
+        fanned_out,
+        batches,
     )
 
 
-@shared_task(limit=ONE_HOUR, routing_key='newsfeeds')
+@shared_task(
+    limit=ONE_HOUR,
+    routing_key='newsfeeds',
+    autoretry_for=TRANSIENT_ERRORS,
+    max_retries=FANOUT_MAX_RETRIES,
+    retry_backoff=True,
+    retry_backoff_max=FANOUT_RETRY_BACKOFF_MAX,
+)
 def fanout_newsfeeds_batch_task(tweet_id, user_ids):
     from newsfeeds.services import NewsFeedService
 
-    newsfeeds = [
-        NewsFeed(user_id=user_id, tweet_id=tweet_id) for user_id in user_ids
-    ]
-    NewsFeed.objects.bulk_create(newsfeeds)
+    start = time.perf_counter()
+    # rows written by a previous attempt are skipped, the rows are read back
+    # since bulk_create does not return ids on mysql
+    NewsFeed.objects.bulk_create(
+        [NewsFeed(user_id=user_id, tweet_id=tweet_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    newsfeeds = list(NewsFeed.objects.filter(tweet_id=tweet_id, user_id__in=user_ids))
+    created = time.perf_counter()
     # bulk_create won't trigger listener
-    for newsfeed in newsfeeds:
-        NewsFeedService.push_newsfeeds_to_redis(newsfeed)
+    pushed = NewsFeedService.push_newsfeeds_to_cached_timelines(newsfeeds)
+    pushed_at = time.perf_counter()
+
+    return (
+        '{} newsfeeds are created in this batch, {} cached timelines are '
+        'updated. db {:.1f}ms, redis {:.1f}ms'
+    ).format(
+        len(newsfeeds),
+        pushed,
+        (created - start) * 1000,
+        (pushed_at - created) * 1000,
+    )
+
+
+@shared_task(
+    limit=ONE_HOUR,
+    routing_key='newsfeeds',
+    autoretry_for=TRANSIENT_ERRORS,
+    max_retries=FANOUT_MAX_RETRIES,
+    retry_backoff=True,
+    retry_backoff_max=FANOUT_RETRY_BACKOFF_MAX,
+)
+def backfill_celebrity_newsfeeds_task(user_id):
+    from newsfeeds.services import NewsFeedService
+
+    # the user stays merged on read until this is done, a retry writes the
+    # existing rows again harmlessly
+    backfilled = NewsFeedService.backfill_celebrity_newsfeeds(user_id)
+    return '{} tweets of a demoted celebrity are backfilled'.format(backfilled)
+
+
+@shared_task(limit=ONE_HOUR, routing_key='default')
+def warm_newsfeeds_task():
+    from newsfeeds.services import NewsFeedService
 
-    return '{} newsfeeds are created in this batch.'.format(len(newsfeeds))
+    extended, rebuilt = NewsFeedService.warm_cached_newsfeeds()
+    return '{} cached newsfeeds are extended, {} are rebuilt'.format(extended, rebuilt)
@@ -1,9 +1,15 @@
+from accounts.services import UserService
+from django.conf import settings
+from django.test import override_settings
+from friendships.models import Friendship
+from friendships.services import FriendshipService
 from newsfeeds.models import NewsFeed
 from newsfeeds.services import NewsFeedService
-from newsfeeds.tasks import fanout_newsfeeds_main_task
+from newsfeeds.tasks import fanout_newsfeeds_batch_task, fanout_newsfeeds_main_task
 from testing.testcases import TestCase
-from twitter.cache import USER_NEWSFEEDS_PATTERN
+from twitter.cache import FANOUT_CHECKPOINT_PATTERN, USER_NEWSFEEDS_PATTERN
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_serializers import IdsModelSerializer
 
 
 class NewsFeedServiceTests(TestCase):
@@ -40,6 +46,64 @@ class NewsFeedServiceTests(TestCase):
         newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
         self.assertEqual([newsfeed.id for newsfeed in newsfeeds], newsfeed_ids)
 
+    def test_cache_newsfeeds_in_redis_sorted_set(self):
+        storages = {'user_tweets': 'list', 'user_newsfeeds': 'sorted_set'}
+        with self.settings(REDIS_TIMELINE_STORAGES=storages):
+            newsfeeds = []
+            for _ in range(3):
+                tweet = self.create_tweet(self.user1)
+                newsfeeds.append(self.create_newsfeed(self.user2, tweet))
+            newsfeeds = newsfeeds[::-1]
+
+            # cache miss, then cache hit
+            RedisClient.clear()
+            for _ in range(2):
+                cached_set = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+                self.assertEqual(
+                    [newsfeed.id for newsfeed in cached_set],
+                    [newsfeed.id for newsfeed in newsfeeds],
+                )
+
+            # push is idempotent
+            NewsFeedService.push_newsfeeds_to_redis(newsfeeds[0])
+            cached_set = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+            self.assertEqual(len(cached_set), 3)
+
+            # seek by created_at
+            older = cached_set.older_than(newsfeeds[0].created_at, 1)
+            self.assertEqual([newsfeed.id for newsfeed in older], [newsfeeds[1].id])
+            newer = cached_set.newer_than(newsfeeds[1].created_at)
+            self.assertEqual([newsfeed.id for newsfeed in newer], [newsfeeds[0].id])
+
+            # the size is capped
+            limit = settings.REDIS_LIST_LENGTH_LIMIT
+            for _ in range(limit):
+                self.create_newsfeed(self.user2, self.create_tweet(self.user1))
+            cached_set = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+            self.assertEqual(len(cached_set), limit)
+
+    def test_hydrate_newsfeeds(self):
+        tweets = [self.create_tweet(user) for user in (self.user1, self.user2)]
+        for tweet in tweets:
+            self.create_newsfeed(self.user2, tweet)
+
+        # only ids are cached in redis
+        conn = RedisClient.get_connection()
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.user2.id)
+        for serialized_data in conn.lrange(key, 0, -1):
+            self.assertEqual(serialized_data[:1], IdsModelSerializer.header)
+
+        newsfeeds = list(NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id))
+        NewsFeedService.hydrate_newsfeeds(newsfeeds)
+        self.assertEqual(
+            [newsfeed.cached_tweet() for newsfeed in newsfeeds],
+            tweets[::-1],
+        )
+        self.assertEqual(
+            [newsfeed.cached_tweet().cached_user() for newsfeed in newsfeeds],
+            [self.user2, self.user1],
+        )
+
 
 class NewsFeedAsyncTaskTests(TestCase):
 
@@ -84,3 +148,149 @@ class NewsFeedAsyncTaskTests(TestCase):
         self.assertEqual(NewsFeed.objects.count(), 16)
         cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.user1.id)
         self.assertEqual(len(cached_list), 4)
+
+        # the batch size can be passed to the task
+        tweet = self.create_tweet(self.user1)
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id, batch_size=1)
+        self.assertEqual(msg, '4 newsfeeds will be fanned out, 4 batches are created')
+        self.assertEqual(NewsFeed.objects.filter(tweet=tweet).count(), 5)
+
+    @override_settings(NEWSFEED_CELEBRITY_FOLLOWER_THRESHOLD=4)
+    def test_celebrity_demotion_backfills_newsfeeds(self):
+        followers = [self.create_user('follower{}'.format(i)) for i in range(4)]
+        for follower in followers:
+            self.create_friendship(follower, self.user1)
+        tweet = self.create_tweet(self.user1)
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(msg, '4 followers, fanout is skipped for a celebrity')
+        self.assertEqual(NewsFeed.objects.filter(tweet=tweet).count(), 1)
+        other_tweet = self.create_tweet(self.user2)
+        self.create_newsfeed(followers[0], other_tweet)
+        # cached before the backfill, it is rebuilt with the backfilled row
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+        self.assertEqual(len(cached_list), 1)
+
+        # below half the threshold, the celebrity era tweet is backfilled
+        # before the user stops being merged on read
+        Friendship.objects.filter(from_user__in=followers[1:]).delete()
+        new_tweet = self.create_tweet(self.user1)
+        msg = fanout_newsfeeds_main_task(new_tweet.id, self.user1.id)
+        self.assertEqual(msg, '1 newsfeeds will be fanned out, 1 batches are created')
+        self.assertEqual(FriendshipService.get_followed_celebrity_ids(followers[0].id), [])
+        newsfeed = NewsFeed.objects.get(user=followers[0], tweet=tweet)
+        self.assertEqual(newsfeed.created_at, tweet.created_at)
+        # dated like the tweet, below the newsfeed written after it
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in cached_list],
+            [new_tweet.id, other_tweet.id, tweet.id],
+        )
+
+    def test_fanout_batch_task_pushes_to_cached_timelines(self):
+        user3 = self.create_user('user3')
+        tweet = self.create_tweet(self.user1)
+        # user2 has a cached timeline, user3 does not
+        self.create_newsfeed(self.user2, self.create_tweet(self.user1))
+        NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+        conn = RedisClient.get_connection()
+        user3_key = USER_NEWSFEEDS_PATTERN.format(user_id=user3.id)
+        self.assertEqual(conn.exists(user3_key), False)
+
+        msg = fanout_newsfeeds_batch_task(tweet.id, [self.user2.id, user3.id])
+        self.assertEqual(
+            msg.startswith(
+                '2 newsfeeds are created in this batch, 1 cached timelines are updated.'
+            ),
+            True,
+        )
+        # not rebuilt by the fanout, loaded from db on read
+        self.assertEqual(conn.exists(user3_key), False)
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in cached_list][0], tweet.id)
+        self.assertEqual(len(cached_list), 2)
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(user3.id)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in cached_list], [tweet.id])
+
+    def test_fanout_is_idempotent(self):
+        user3 = self.create_user('user3')
+        tweet = self.create_tweet(self.user1)
+        NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+        self.create_newsfeed(self.user2, self.create_tweet(self.user1))
+
+        # a retried batch neither fails on the unique constraint nor pushes
+        # the same newsfeed twice
+        for _ in range(2):
+            fanout_newsfeeds_batch_task(tweet.id, [self.user2.id, user3.id])
+        self.assertEqual(NewsFeed.objects.filter(tweet=tweet).count(), 2)
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in cached_list][0], tweet.id)
+        self.assertEqual(len(cached_list), 2)
+        self.assertEqual(
+            cached_list[0].id,
+            NewsFeed.objects.get(user=self.user2, tweet=tweet).id,
+        )
+
+    def test_fanout_resumes_from_checkpoint(self):
+        followers = [self.create_user('follower{}'.format(i)) for i in range(4)]
+        friendships = [
+            self.create_friendship(follower, self.user1)
+            for follower in followers
+        ]
+        tweet = self.create_tweet(self.user1)
+        conn = RedisClient.get_connection()
+        checkpoint_key = FANOUT_CHECKPOINT_PATTERN.format(tweet_id=tweet.id)
+        conn.set(checkpoint_key, FriendshipService.encode_follower_cursor(
+            friendships[1].created_at,
+            friendships[1].id,
+        ))
+
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(msg, '2 newsfeeds will be fanned out, 1 batches are created')
+        self.assertEqual(
+            set(NewsFeed.objects.filter(tweet=tweet).values_list('user_id', flat=True)),
+            {self.user1.id, followers[2].id, followers[3].id},
+        )
+        self.assertEqual(conn.exists(checkpoint_key), False)
+
+        # running it again fans out to everyone without duplicates
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(msg, '4 newsfeeds will be fanned out, 2 batches are created')
+        self.assertEqual(NewsFeed.objects.filter(tweet=tweet).count(), 5)
+
+    def test_fanout_active_followers_first(self):
+        followers = [self.create_user('follower{}'.format(i)) for i in range(4)]
+        for follower in followers:
+            self.create_friendship(follower, self.user1)
+        UserService.mark_active(followers[1].id)
+        UserService.mark_active(followers[3].id)
+
+        tweet = self.create_tweet(self.user1)
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(msg, '4 newsfeeds will be fanned out, 2 batches are created')
+        # tasks run eagerly in tests, so the creation order is the dispatch order
+        user_ids = list(
+            NewsFeed.objects.filter(tweet=tweet)
+            .exclude(user=self.user1)
+            .order_by('id')
+            .values_list('user_id', flat=True)
+        )
+        self.assertEqual(set(user_ids[:2]), {followers[1].id, followers[3].id})
+        self.assertEqual(set(user_ids[2:]), {followers[0].id, followers[2].id})
+
+    def test_warm_cached_newsfeeds(self):
+        tweet = self.create_tweet(self.user1)
+        self.create_newsfeed(self.user2, tweet)
+        conn = RedisClient.get_connection()
+        RedisClient.clear()
+        UserService.mark_active(self.user1.id)
+        UserService.mark_active(self.user2.id)
+
+        # missing newsfeeds are rebuilt, an empty one is not cached
+        self.assertEqual(NewsFeedService.warm_cached_newsfeeds(), (0, 1))
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.user2.id)
+        self.assertEqual(conn.llen(key), 1)
+
+        # about to expire, the ttl is extended
+        conn.expire(key, 60)
+        self.assertEqual(NewsFeedService.warm_cached_newsfeeds(), (1, 0))
+        self.assertEqual(conn.ttl(key) > 60, True)
@@ -1,14 +1,30 @@
 from accounts.api.serializers import UserSerializerForTweet
 from comments.api.serializers import CommentSerializer
-from likes.api.serializers import LikeSerializer
-from likes.services import LikeService
-from random import randint
+from django.db import models
+from likes.api.serializers import LikeSerializer, ListSerializerWithLikes
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.constants import TWEET_PHOTO_UPLOAD_LIMIT
 from tweets.models import Tweet
 from tweets.services import TweetService
-from utils.redis.redis_helper import RedisHelper
+
+
+class TweetListSerializer(ListSerializerWithLikes):
+    # photo urls of the whole page are resolved with one get_many
+    counter_attrs = ('likes_count', 'comments_count')
+
+    @classmethod
+    def attach_photo_urls(cls, context, tweets):
+        context.setdefault('photo_urls', {}).update(
+            TweetService.get_photo_urls_map(tweets),
+        )
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        tweets = list(data)
+        self.attach_photo_urls(self.context, tweets)
+        return super().to_representation(tweets)
 
 
 class TweetSerializer(serializers.ModelSerializer):
@@ -30,39 +46,26 @@ class TweetSerializer(serializers.ModelSerializer):
             'comments_count',
             'photo_urls',
         )
+        list_serializer_class = TweetListSerializer
 
     def get_has_liked(self, obj):
-        return LikeService.has_liked(self.context['request'].user, obj)
+        return ListSerializerWithLikes.get_has_liked(self.context, obj)
 
     def get_likes_count(self, obj):
-        # randomly check if likes count is consistent
-        if randint(0, 999) == 0:
-            obj.refresh_from_db()
-            actual_likes_count = obj.like_set.count()
-            if obj.likes_count != actual_likes_count:
-                obj.likes_count = actual_likes_count
-                obj.save()
-                return actual_likes_count
-
-        return RedisHelper.get_count(obj, 'likes_count')
+        return ListSerializerWithLikes.get_count(self.context, obj, 'likes_count')
 
     def get_comments_count(self, obj):
-        if randint(0, 999) == 0:
-            obj.refresh_from_db()
-            actual_comments_count = obj.comment_set.count()
-            if obj.comments_count != actual_comments_count:
-                obj.comments_count = actual_comments_count
-                obj.save()
-                return actual_comments_count
-
-        return RedisHelper.get_count(obj, 'comments_count')
+        return ListSerializerWithLikes.get_count(
+            self.context,
+            obj,
+            'comments_count',
+        )
 
     def get_photo_urls(self, obj):
-        photo_urls = []
-        tweet_photos = obj.tweetphoto_set.all().order_by('order')
-        for tweet_photo in tweet_photos:
-            photo_urls.append(tweet_photo.file.url)
-        return photo_urls
+        photo_urls_map = self.context.get('photo_urls', {})
+        if obj.id in photo_urls_map:
+            return photo_urls_map[obj.id]
+        return TweetService.get_photo_urls_map([obj])[obj.id]
 
 
 class TweetSerializerForCreate(serializers.ModelSerializer):
@@ -4,3 +4,11 @@ def push_tweet_to_redis(sender, instance, created, **kwargs):
         return
 
     TweetService.push_tweet_to_redis(instance)
+
+
+def invalidate_photo_cache(sender, instance, **kwargs):
+    from tweets.services import TweetService
+    if instance.tweet_id is None:
+        return
+
+    TweetService.invalidate_photo_cache(instance.tweet_id)
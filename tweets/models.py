@@ -4,7 +4,7 @@ from django.db import models
 from django.db.models.signals import post_save, pre_delete
 from likes.models import Like
 from tweets.constants import TweetPhotoStatus, TWEET_PHOTO_STATUS_CHOICES
-from tweets.listeners import push_tweet_to_redis
+from tweets.listeners import invalidate_photo_cache, push_tweet_to_redis
 from utils.memcached.listeners import invalidate_object_cache
 from utils.memcached.memcached_helper import MemcachedHelper
 from utils.time_helpers import utc_now
@@ -36,6 +36,9 @@ class Tweet(models.Model):
         ).order_by('-created_at')
 
     def cached_user(self):
+        # set by the batched hydration of a page
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemcachedHelper.get_object_through_cache(User, self.user_id)
 
 
@@ -64,8 +67,22 @@ class TweetPhoto(models.Model):
         return '{} {}'.format(self.tweet, self.file)
 
 
+class CounterFlushBatch(models.Model):
+    # write-behind counter batches already applied to db, a batch found here
+    # is not applied again when a flush crashed after its commit
+    batch_id = models.CharField(max_length=32, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.created_at, self.batch_id)
+
+
 post_save.connect(invalidate_object_cache, sender=Tweet)
 pre_delete.connect(invalidate_object_cache, sender=Tweet)
 
 # new tweet is created, push to redis
 post_save.connect(push_tweet_to_redis, sender=Tweet)
+
+# photo added, moderated or deleted, drop the cached photo list of the tweet
+post_save.connect(invalidate_photo_cache, sender=TweetPhoto)
+pre_delete.connect(invalidate_photo_cache, sender=TweetPhoto)
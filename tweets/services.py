@@ -1,7 +1,12 @@
+from django.conf import settings
+from django.core.cache import caches
+from tweets.constants import TweetPhotoStatus
 from tweets.models import Tweet, TweetPhoto
-from twitter.cache import USER_TWEETS_PATTERN
+from twitter.cache import TWEET_PHOTOS_PATTERN, USER_TWEETS_PATTERN
 from utils.redis.redis_helper import RedisHelper
 
+cache = caches['testing'] if settings.TESTING else caches['default']
+
 
 class TweetService:
 
@@ -17,15 +22,63 @@ class TweetService:
             )
             photos.append(photo)
         TweetPhoto.objects.bulk_create(photos)
+        # bulk_create does not send post_save
+        cls.invalidate_photo_cache(tweet.id)
+
+    @classmethod
+    def get_photo_urls_map(cls, tweets):
+        # {tweet_id: [photo url]} for a whole page with one get_many and one
+        # db query for the misses. file names are cached instead of urls,
+        # signed storage urls expire
+        keys = {
+            TWEET_PHOTOS_PATTERN.format(tweet_id=tweet.id): tweet.id
+            for tweet in tweets
+        }
+        cached_file_names = cache.get_many(keys)
+        file_names_map = {
+            keys[key]: file_names
+            for key, file_names in cached_file_names.items()
+        }
+
+        missing_ids = [
+            tweet_id for tweet_id in keys.values() if tweet_id not in file_names_map
+        ]
+        if missing_ids:
+            db_file_names_map = {tweet_id: [] for tweet_id in missing_ids}
+            photos = TweetPhoto.objects.filter(
+                tweet_id__in=missing_ids,
+                has_deleted=False,
+            ).exclude(
+                status=TweetPhotoStatus.REJECTED,
+            ).order_by('tweet_id', 'order').values_list('tweet_id', 'file')
+            for tweet_id, file_name in photos:
+                if file_name:
+                    db_file_names_map[tweet_id].append(file_name)
+            # tweets without photos are cached as empty lists
+            cache.set_many({
+                TWEET_PHOTOS_PATTERN.format(tweet_id=tweet_id): file_names
+                for tweet_id, file_names in db_file_names_map.items()
+            })
+            file_names_map.update(db_file_names_map)
+
+        storage = TweetPhoto._meta.get_field('file').storage
+        return {
+            tweet_id: [storage.url(file_name) for file_name in file_names]
+            for tweet_id, file_names in file_names_map.items()
+        }
+
+    @classmethod
+    def invalidate_photo_cache(cls, tweet_id):
+        cache.delete(TWEET_PHOTOS_PATTERN.format(tweet_id=tweet_id))
 
     @classmethod
     def get_cached_tweets_from_redis(cls, user_id):
         queryset = Tweet.objects.filter(user_id=user_id).order_by('-created_at')
         key = USER_TWEETS_PATTERN.format(user_id=user_id)
-        return RedisHelper.load_objects(key, queryset)
+        return RedisHelper.get_timeline_helper('user_tweets').load_objects(key, queryset)
 
     @classmethod
     def push_tweet_to_redis(cls, tweet):
         queryset = Tweet.objects.filter(user_id=tweet.user_id).order_by('-created_at')
         key = USER_TWEETS_PATTERN.format(user_id=tweet.user_id)
-        RedisHelper.push_object(key, tweet, queryset)
+        RedisHelper.get_timeline_helper('user_tweets').push_object(key, tweet, queryset)
@@ -0,0 +1,38 @@
+from celery import shared_task
+from utils.redis.redis_counters import RedisCounterHelper
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(limit=ONE_HOUR, routing_key='default')
+def flush_counter_deltas_task():
+    updated = RedisCounterHelper.flush()
+    if updated is None:
+        return 'another flush is running'
+    return '{} counters are flushed'.format(updated)
+
+
+@shared_task(limit=ONE_HOUR, routing_key='default')
+def reconcile_counters_task():
+    from comments.models import Comment
+    from comments.services import CommentService
+    from likes.services import LikeService
+    from tweets.models import Tweet
+
+    counters = (
+        (Tweet, 'likes_count', lambda ids: LikeService.get_likes_counts(Tweet, ids)),
+        (Tweet, 'comments_count', CommentService.get_comments_counts),
+        (Comment, 'likes_count', lambda ids: LikeService.get_likes_counts(Comment, ids)),
+    )
+    total_checked = total_fixed = 0
+    for model_class, attr, get_actual_counts in counters:
+        checked, fixed = RedisCounterHelper.reconcile(
+            model_class,
+            attr,
+            get_actual_counts,
+        )
+        total_checked += checked
+        total_fixed += fixed
+    return '{} counters are checked, {} are fixed'.format(
+        total_checked,
+        total_fixed,
+    )
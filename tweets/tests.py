@@ -78,3 +78,45 @@ class TweetTests(TestCase):
         tweets = TweetService.get_cached_tweets_from_redis(user.id)
         tweet_ids.insert(0, new_tweet.id)
         self.assertEqual(tweet_ids, [tweet.id for tweet in tweets])
+
+    def test_photo_urls_map(self):
+        self.clear_cache()
+        user = self.create_user('test_user')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        for order, status in enumerate([
+            TweetPhotoStatus.APPROVED,
+            TweetPhotoStatus.REJECTED,
+            TweetPhotoStatus.PENDING,
+        ]):
+            TweetPhoto.objects.create(
+                user=user,
+                tweet=tweets[0],
+                file='photo{}.jpg'.format(order),
+                order=2 - order,
+                status=status,
+            )
+        TweetPhoto.objects.create(
+            user=user,
+            tweet=tweets[1],
+            file='deleted.jpg',
+            has_deleted=True,
+        )
+
+        photo_urls_map = TweetService.get_photo_urls_map(tweets)
+        self.assertEqual(len(photo_urls_map), 3)
+        # ordered by order, rejected and deleted photos are left out
+        self.assertEqual(len(photo_urls_map[tweets[0].id]), 2)
+        self.assertEqual('photo2' in photo_urls_map[tweets[0].id][0], True)
+        self.assertEqual('photo0' in photo_urls_map[tweets[0].id][1], True)
+        self.assertEqual(photo_urls_map[tweets[1].id], [])
+        self.assertEqual(photo_urls_map[tweets[2].id], [])
+
+        # cache hit, no db query
+        with self.assertNumQueries(0):
+            self.assertEqual(TweetService.get_photo_urls_map(tweets), photo_urls_map)
+
+        # a new photo invalidates the cached list of its tweet
+        TweetPhoto.objects.create(user=user, tweet=tweets[2], file='new.jpg')
+        photo_urls_map = TweetService.get_photo_urls_map(tweets)
+        self.assertEqual(len(photo_urls_map[tweets[2].id]), 1)
+        self.assertEqual('new' in photo_urls_map[tweets[2].id][0], True)
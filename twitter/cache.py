@@ -1,7 +1,34 @@
 # memcached key
 FOLLOWING_PATTERNS = 'followings:{user_id}'
 USER_PROFILE_PATTERN = 'user_profile:{user_id}'
+TWEET_PHOTOS_PATTERN = 'tweet_photos:{tweet_id}'
+SOFT_TTL_REFRESH_LOCK_PATTERN = 'soft_ttl_refresh:{key}'
+SOFT_TTL_GENERATION_PATTERN = 'soft_ttl_generation:{key}'
+QUERYSET_COUNT_PATTERN = 'queryset_count:{query_hash}'
 
 # redis key
 USER_TWEETS_PATTERN = 'user_tweets:{user_id}'
-USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
\ No newline at end of file
+USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
+USER_LIKED_PATTERN = 'user_liked:{user_id}:{model}'
+USER_LIKED_FILL_LOCK_PATTERN = 'user_liked_fill_lock:{key}'
+CELEBRITY_USER_IDS_KEY = 'celebrity_user_ids'
+# {user_id: timestamp} of when each celebrity stopped being fanned out
+CELEBRITY_SINCE_KEY = 'celebrity_since'
+# demoted celebrities whose tweets are still merged on read until the
+# backfill of their celebrity era tweets is done
+DEMOTING_CELEBRITY_IDS_KEY = 'demoting_celebrity_ids'
+USER_ACTIVITY_KEY = 'user_activity'
+FANOUT_CHECKPOINT_PATTERN = 'fanout_checkpoint:{tweet_id}'
+TIMELINE_REBUILD_LOCK_PATTERN = 'timeline_rebuild_lock:{key}'
+# e.g. Tweet.likes_count:1
+COUNTER_PATTERN = '{model}.{attr}:{object_id}'
+COUNTER_DELTAS_KEY = 'counter_deltas'
+COUNTER_DELTAS_PROCESSING_KEY = 'counter_deltas:processing'
+COUNTER_DELTAS_BATCH_KEY = 'counter_deltas:batch_id'
+COUNTER_FLUSH_LOCK_KEY = 'counter_deltas:lock'
+COUNTER_RECONCILE_CHECKPOINT_PATTERN = 'counter_reconcile:{field}'
+# memcached stale serves and hard misses per model
+MEMCACHED_STATS_KEY = 'memcached_stats'
+
+# redis pub/sub channel
+LOCAL_CACHE_INVALIDATION_CHANNEL = 'local_cache_invalidation'
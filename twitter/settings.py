@@ -62,6 +62,7 @@ REST_FRAMEWORK = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'utils.middlewares.RequestCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -178,23 +179,125 @@ CACHES = {
     },
 }
 
+# memcached objects and profiles are fresh for SOFT_TIMEOUT seconds and then
+# served stale for up to GRACE more seconds while one background task
+# refreshes them. both are shortened by a random share of up to JITTER, so
+# entries cached at the same time do not expire at the same time
+MEMCACHED_SOFT_TTL = {
+    'SOFT_TIMEOUT': 86400,
+    'GRACE': 3600,
+    'JITTER': 0.1,
+    'REFRESH_LOCK_TIME': 30,
+}
+# objects missing in db are cached as tombstones for this long, a lookup
+# racing with the creation of the object may keep it missing until then
+MEMCACHED_TOMBSTONE_TIMEOUT = 60  # in seconds
+# total_count of cursor paginated lists is cached for this long
+PAGINATION_COUNT_CACHE_TIME = 10 * 60  # in seconds
+
+# in process LRU in front of memcached for hot objects, entries are dropped
+# through redis pub/sub on change and live at most TTL seconds
+LOCAL_OBJECT_CACHE = {
+    'ENABLED': False,
+    'MODELS': ('User', 'UserProfile', 'Tweet'),
+    'MAX_SIZE': 10000,
+    'TTL': 10,
+}
+
 # redis install: sudo apt-get install redis
 # pip install redis
 REDIS_HOST = '127.0.0.1'
 REDIS_PORT = 6379
 REDIS_DB = 0 if TESTING else 1
 REDIS_KEY_EXPIRE_TIME = 7 * 86400  # in seconds
+# counters are only created by reads and always expire, increments keep the
+# ttl, so the keyspace is bounded by what was read in the last period. run
+# redis with maxmemory-policy volatile-lru to bound it by size as well
+REDIS_COUNTER_EXPIRE_TIME = 86400  # in seconds
 REDIS_LIST_LENGTH_LIMIT = 200 if not TESTING else 20
+# 'compact' (binary) or 'json' (legacy), both formats can always be read
+REDIS_SERIALIZER_FORMAT = 'compact'
+# per model override, 'ids' only keeps the primary key, foreign keys and
+# created_at, e.g. a newsfeed is cached as (id, user_id, tweet_id, created_at)
+REDIS_SERIALIZER_MODEL_FORMATS = {
+    'newsfeeds.NewsFeed': 'ids',
+}
+# use lua scripts for atomic single round trip operations, when scripting is
+# not available the helpers fall back to WATCH/MULTI transactions
+REDIS_SCRIPTS_ENABLED = True
+# storage of each cached timeline: 'list' or 'sorted_set' (scored by
+# created_at, O(log n) cursor seeks and idempotent inserts)
+REDIS_TIMELINE_STORAGES = {
+    'user_tweets': 'list',
+    'user_newsfeeds': 'list',
+}
+# a missing timeline is rebuilt by one request holding a lock, concurrent
+# misses wait up to REDIS_REBUILD_WAIT_TIME for it and then read from db
+REDIS_REBUILD_LOCK_TIME = 10  # in seconds
+REDIS_REBUILD_WAIT_TIME = 0.2  # in seconds
+# tweets of users with at least this many followers are not fanned out, the
+# readers merge them into their newsfeeds. a celebrity is demoted again once
+# below half the threshold, so an account around the threshold does not flip
+# between the two modes
+NEWSFEED_CELEBRITY_FOLLOWER_THRESHOLD = 10000
+# followers who logged in or read their newsfeeds within this window are
+# fanned out first through the newsfeeds_priority queue
+NEWSFEED_ACTIVE_USER_WINDOW = 7 * 86400  # in seconds
+# newsfeeds of users active within the warm window are rebuilt or have
+# their ttl extended by the warmer before they expire
+NEWSFEED_WARM_ACTIVE_WINDOW = 86400  # in seconds
+NEWSFEED_WARM_TTL_THRESHOLD = 86400  # in seconds
+NEWSFEED_WARM_MAX_USERS = 1000
+NEWSFEED_WARM_INTERVAL = 10 * 60  # in seconds
+# per user set of liked object ids, users with more likes only keep the most
+# recent ones and check the rest in db
+USER_LIKED_SET_SIZE_LIMIT = 1000 if not TESTING else 5
+USER_LIKED_SET_EXPIRE_TIME = 86400  # in seconds
+# likes_count/comments_count changes are summed in redis and written to db by
+# flush_counter_deltas_task. only turn it on where celery beat runs, without
+# the flush the db counters stop moving
+COUNTER_WRITE_BEHIND_ENABLED = False
+COUNTER_FLUSH_INTERVAL = 10  # in seconds
+# reconcile_counters_task walks every counter table from a checkpoint and
+# repairs counters that differ from the aggregated rows
+COUNTER_RECONCILE_INTERVAL = 60  # in seconds
+COUNTER_RECONCILE_BATCH_SIZE = 500
+COUNTER_RECONCILE_BATCHES_PER_RUN = 20
 
 # Celery Configuration Options
 # Start worker proces: celery -A twitter worker -l INFO
+# a worker consuming several queues takes turns between them, the broker
+# has no queue priority. the fanout of active followers only goes first
+# with a worker of its own:
+#   celery -A twitter worker -l INFO -Q newsfeeds_priority
+#   celery -A twitter worker -l INFO -Q newsfeeds,default
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0' if TESTING else 'redis://127.0.0.1:6379/2'
 CELERY_TIMEZONE = "UTC"
 CELERY_TASK_ALWAYS_EAGER = TESTING  # if true, celery will run Synchronously!
 CELERY_QUEUES = [
     Queue('default', routing_key='default'),
+    Queue('newsfeeds_priority', routing_key='newsfeeds_priority'),
     Queue('newsfeeds', routing_key='newsfeeds')
 ]
+# Start scheduler: celery -A twitter beat -l INFO
+CELERY_BEAT_SCHEDULE = {
+    'flush-counter-deltas': {
+        'task': 'tweets.tasks.flush_counter_deltas_task',
+        'schedule': COUNTER_FLUSH_INTERVAL,
+    },
+    'reconcile-counters': {
+        'task': 'tweets.tasks.reconcile_counters_task',
+        'schedule': COUNTER_RECONCILE_INTERVAL,
+    },
+    'prune-dormant-users': {
+        'task': 'accounts.tasks.prune_dormant_users_task',
+        'schedule': 86400,
+    },
+    'warm-newsfeeds': {
+        'task': 'newsfeeds.tasks.warm_newsfeeds_task',
+        'schedule': NEWSFEED_WARM_INTERVAL,
+    },
+}
 
 # Rate Limiter
 RATELIMIT_USE_CACHE = 'ratelimit'
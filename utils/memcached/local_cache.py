@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from django.conf import settings
+from twitter.cache import LOCAL_CACHE_INVALIDATION_CHANNEL
+from utils.memcached.request_cache import MISSING
+from utils.redis.redis_client import RedisClient
+import copy
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    # bounded in process LRU for hot objects in front of memcached. entries
+    # are dropped through a redis pub/sub channel when the object changes,
+    # the ttl bounds the staleness if an invalidation message is lost
+    lock = threading.Lock()
+    objects = OrderedDict()
+    subscriber_pid = None
+
+    @classmethod
+    def is_enabled(cls, model_name):
+        config = settings.LOCAL_OBJECT_CACHE
+        return config['ENABLED'] and model_name in config['MODELS']
+
+    @classmethod
+    def _copy(cls, obj):
+        # callers attach per request attributes to the objects they get,
+        # the shared instance must never see them
+        new_obj = obj.__class__.__new__(obj.__class__)
+        new_obj.__dict__.update(obj.__dict__)
+        new_obj._state = copy.copy(obj._state)
+        new_obj._state.fields_cache = {}
+        return new_obj
+
+    @classmethod
+    def get(cls, model_name, key):
+        if not cls.is_enabled(model_name):
+            return MISSING
+        cls._ensure_subscriber()
+        with cls.lock:
+            expire_at, obj = cls.objects.get(key, (None, MISSING))
+            if obj is MISSING:
+                return MISSING
+            if expire_at < time.monotonic():
+                del cls.objects[key]
+                return MISSING
+            cls.objects.move_to_end(key)
+        return cls._copy(obj)
+
+    @classmethod
+    def set(cls, model_name, key, obj):
+        if not cls.is_enabled(model_name):
+            return
+        config = settings.LOCAL_OBJECT_CACHE
+        expire_at = time.monotonic() + config['TTL']
+        obj = cls._copy(obj)
+        with cls.lock:
+            cls.objects[key] = (expire_at, obj)
+            cls.objects.move_to_end(key)
+            while len(cls.objects) > config['MAX_SIZE']:
+                cls.objects.popitem(last=False)
+
+    @classmethod
+    def delete(cls, key):
+        with cls.lock:
+            cls.objects.pop(key, None)
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.objects.clear()
+
+    @classmethod
+    def invalidate(cls, model_name, key):
+        if not cls.is_enabled(model_name):
+            return
+        cls.delete(key)
+        conn = RedisClient.get_connection()
+        conn.publish(LOCAL_CACHE_INVALIDATION_CHANNEL, key)
+
+    @classmethod
+    def _ensure_subscriber(cls):
+        # one listener thread per process, started again after a fork
+        if cls.subscriber_pid == os.getpid():
+            return
+        with cls.lock:
+            if cls.subscriber_pid == os.getpid():
+                return
+            cls.subscriber_pid = os.getpid()
+            cls.objects.clear()
+        thread = threading.Thread(target=cls._listen, daemon=True)
+        thread.start()
+
+    @classmethod
+    def _listen(cls):
+        while True:
+            try:
+                pubsub = RedisClient.get_connection().pubsub(
+                    ignore_subscribe_messages=True,
+                )
+                pubsub.subscribe(LOCAL_CACHE_INVALIDATION_CHANNEL)
+                # messages may have been missed while not subscribed
+                cls.clear()
+                for message in pubsub.listen():
+                    cls.delete(message['data'].decode())
+            except Exception:
+                logger.exception('local cache invalidation listener failed')
+                cls.clear()
+                time.sleep(1)
@@ -1,7 +1,7 @@
-from django.conf import settings
-from django.core.cache import caches
-
-cache = caches['testing'] if settings.TESTING else caches['default']
+from utils.memcached.local_cache import LocalCache
+from utils.memcached.request_cache import MISSING, RequestCache
+from utils.memcached.soft_ttl_cache import TOMBSTONE, SoftTTLCache
+from utils.memcached.tasks import refresh_cached_objects_task
 
 
 class MemcachedHelper:
@@ -10,18 +10,133 @@ class MemcachedHelper:
     def get_key(cls, model_class, object_id):
         return '{}:{}'.format(model_class.__name__, object_id)
 
+    @classmethod
+    def _does_not_exist(cls, model_class):
+        return model_class.DoesNotExist(
+            '{} matching query does not exist.'.format(model_class._meta.object_name),
+        )
+
+    @classmethod
+    def get_cached_objects(cls, object_ids, get_key, model_name, fetch, refresh_stale):
+        # the lookup of every cached model: the request cache, the local
+        # cache, one memcached get_many, then one fetch(object_ids) from db
+        # returning {object_id: obj} for the misses and one set_many backfill.
+        # stale entries are served and passed to refresh_stale as
+        # {key: object_id}. returns {object_id: obj}, objects missing in db
+        # are left out and cached as tombstones
+        keys = {
+            get_key(object_id): object_id
+            for object_id in set(object_ids)
+            if object_id is not None
+        }
+        cached_objects = RequestCache.get_many(keys)
+        for key in keys:
+            if key in cached_objects:
+                continue
+            obj = LocalCache.get(model_name, key)
+            if obj is not MISSING:
+                cached_objects[key] = obj
+        memcached_objects = {}
+        stale_keys = {}
+        for key, (obj, is_stale) in SoftTTLCache.get_many([
+            key for key in keys if key not in cached_objects
+        ]).items():
+            memcached_objects[key] = obj
+            if is_stale:
+                stale_keys[key] = keys[key]
+        if stale_keys:
+            SoftTTLCache.record(model_name, stale=len(stale_keys))
+            refresh_stale(stale_keys)
+        for key, obj in memcached_objects.items():
+            if not SoftTTLCache.is_tombstone(obj):
+                LocalCache.set(model_name, key, obj)
+        cached_objects.update(memcached_objects)
+        RequestCache.set_many(cached_objects)
+        objects = {
+            keys[key]: obj
+            for key, obj in cached_objects.items()
+            if not SoftTTLCache.is_tombstone(obj)
+        }
+
+        missing_keys = {
+            key: object_id for key, object_id in keys.items() if key not in cached_objects
+        }
+        if missing_keys:
+            SoftTTLCache.record(model_name, miss=len(missing_keys))
+            db_objects = fetch(list(missing_keys.values()))
+            db_cached_objects = {
+                key: db_objects[object_id]
+                for key, object_id in missing_keys.items()
+                if object_id in db_objects
+            }
+            cls.set_cached_objects(model_name, db_cached_objects)
+            objects.update(db_objects)
+            tombstones = {
+                key: TOMBSTONE
+                for key, object_id in missing_keys.items()
+                if object_id not in db_objects
+            }
+            if tombstones:
+                SoftTTLCache.set_tombstones(list(tombstones))
+                RequestCache.set_many(tombstones)
+        return objects
+
+    @classmethod
+    def set_cached_objects(cls, model_name, objects):
+        # {key: obj} read from db
+        SoftTTLCache.set_many(objects)
+        RequestCache.set_many(objects)
+        for key, obj in objects.items():
+            LocalCache.set(model_name, key, obj)
+
     @classmethod
     def get_object_through_cache(cls, model_class, object_id):
-        key = cls.get_key(model_class, object_id)
-        obj = cache.get(key)
-        if obj:
-            return obj
+        # e.g. a newsfeed whose tweet was deleted has no object_id
+        objects = cls.get_objects_through_cache(model_class, [object_id])
+        if object_id not in objects:
+            raise cls._does_not_exist(model_class)
+        return objects[object_id]
+
+    @classmethod
+    def get_objects_through_cache(cls, model_class, object_ids):
+        return cls.get_cached_objects(
+            object_ids,
+            lambda object_id: cls.get_key(model_class, object_id),
+            model_class.__name__,
+            model_class.objects.in_bulk,
+            lambda stale_keys: cls._refresh_stale_objects(model_class, stale_keys),
+        )
 
-        obj = model_class.objects.get(id=object_id)
-        cache.set(key, obj)
-        return obj
+    @classmethod
+    def _refresh_stale_objects(cls, model_class, stale_keys):
+        # {key: object_id} served stale, refreshed by one background task
+        keys = SoftTTLCache.acquire_refresh(list(stale_keys))
+        if keys:
+            generations = SoftTTLCache.get_generations(keys)
+            refresh_cached_objects_task.delay(
+                model_class._meta.label,
+                [stale_keys[key] for key in keys],
+                [generations[key] for key in keys],
+            )
+
+    @classmethod
+    def refresh_cached_objects(cls, model_class, object_ids, generations):
+        # generations of the keys as read before the refresh was enqueued
+        generations = {
+            cls.get_key(model_class, object_id): generation
+            for object_id, generation in zip(object_ids, generations)
+        }
+        objects = {
+            cls.get_key(model_class, obj.id): obj
+            for obj in model_class.objects.filter(id__in=object_ids)
+        }
+        if not objects:
+            return 0
+        return SoftTTLCache.refresh_many(objects, generations)
 
     @classmethod
     def invalidate_cached_object(cls, model_class, object_id):
         key = cls.get_key(model_class, object_id)
-        cache.delete(key)
+        SoftTTLCache.invalidate(key)
+        RequestCache.delete(key)
+        LocalCache.invalidate(model_class.__name__, key)
@@ -0,0 +1,65 @@
+import threading
+
+MISSING = object()
+
+
+class RequestCache:
+    # per request identity map in front of memcached, only active between
+    # RequestCacheMiddleware activate/deactivate, so celery tasks and shells
+    # always read through to memcached
+    local = threading.local()
+
+    @classmethod
+    def activate(cls):
+        cls.local.objects = {}
+        cls.local.hits = 0
+        cls.local.misses = 0
+
+    @classmethod
+    def deactivate(cls):
+        cls.local.objects = None
+
+    @classmethod
+    def is_active(cls):
+        return getattr(cls.local, 'objects', None) is not None
+
+    @classmethod
+    def get(cls, key):
+        if not cls.is_active():
+            return MISSING
+        obj = cls.local.objects.get(key, MISSING)
+        if obj is MISSING:
+            cls.local.misses += 1
+        else:
+            cls.local.hits += 1
+        return obj
+
+    @classmethod
+    def get_many(cls, keys):
+        objects = {}
+        for key in keys:
+            obj = cls.get(key)
+            if obj is not MISSING:
+                objects[key] = obj
+        return objects
+
+    @classmethod
+    def set(cls, key, obj):
+        if cls.is_active():
+            cls.local.objects[key] = obj
+
+    @classmethod
+    def set_many(cls, objects):
+        if cls.is_active():
+            cls.local.objects.update(objects)
+
+    @classmethod
+    def delete(cls, key):
+        if cls.is_active():
+            cls.local.objects.pop(key, None)
+
+    @classmethod
+    def get_stats(cls):
+        if not cls.is_active():
+            return {'hits': 0, 'misses': 0}
+        return {'hits': cls.local.hits, 'misses': cls.local.misses}
@@ -0,0 +1,163 @@
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import caches
+from twitter.cache import (
+    MEMCACHED_STATS_KEY,
+    SOFT_TTL_GENERATION_PATTERN,
+    SOFT_TTL_REFRESH_LOCK_PATTERN,
+)
+from utils.memcached.request_cache import MISSING
+from utils.redis.redis_client import RedisClient
+import random
+import time
+import uuid
+
+cache = caches['testing'] if settings.TESTING else caches['default']
+
+SoftTTLEntry = namedtuple('SoftTTLEntry', ['fresh_until', 'obj'])
+# cached for a short while in place of an object missing in db, so lookups
+# of deleted or never existing ids do not reach db every time. saving an
+# object deletes its key, which drops the tombstone
+TOMBSTONE = 'tombstone'
+
+
+class SoftTTLCache:
+    # entries live in memcached GRACE seconds longer than they are fresh, a
+    # stale entry is still served while one background task refreshes it.
+    # both timeouts are shortened by a random share of up to JITTER so that
+    # entries cached together (e.g. after a restart) do not expire together
+
+    @classmethod
+    def _get_timeouts(cls):
+        config = settings.MEMCACHED_SOFT_TTL
+        soft_timeout = config['SOFT_TIMEOUT'] * (1 - random.random() * config['JITTER'])
+        return soft_timeout, int(soft_timeout + config['GRACE'])
+
+    @classmethod
+    def _unwrap(cls, value):
+        # (obj, is_stale), entries written before soft ttl are plain objects
+        # and count as fresh until they expire
+        if not isinstance(value, SoftTTLEntry):
+            return value, False
+        return value.obj, value.fresh_until < time.time()
+
+    @classmethod
+    def get(cls, key):
+        value = cache.get(key, MISSING)
+        if value is MISSING:
+            return MISSING, False
+        return cls._unwrap(value)
+
+    @classmethod
+    def get_many(cls, keys):
+        # {key: (obj, is_stale)} of the keys found
+        return {
+            key: cls._unwrap(value)
+            for key, value in cache.get_many(keys).items()
+        }
+
+    @classmethod
+    def set(cls, key, obj):
+        soft_timeout, timeout = cls._get_timeouts()
+        cache.set(key, SoftTTLEntry(time.time() + soft_timeout, obj), timeout)
+
+    @classmethod
+    def set_many(cls, objects):
+        # one set_many per timeout, the jitter is per batch
+        soft_timeout, timeout = cls._get_timeouts()
+        fresh_until = time.time() + soft_timeout
+        cache.set_many({
+            key: SoftTTLEntry(fresh_until, obj)
+            for key, obj in objects.items()
+        }, timeout)
+
+    @classmethod
+    def get_generations(cls, keys):
+        # {key: generation}, None for keys not invalidated lately. read before
+        # a refresh queries db and passed along to refresh_many
+        generation_keys = {
+            SOFT_TTL_GENERATION_PATTERN.format(key=key): key for key in keys
+        }
+        generations = cache.get_many(list(generation_keys))
+        return {
+            key: generations.get(generation_key)
+            for generation_key, key in generation_keys.items()
+        }
+
+    @classmethod
+    def invalidate(cls, key):
+        # the generation changes before the entry is deleted, a refresh that
+        # read db before the change sees it and does not write the old object
+        # back. it only has to outlive the refreshes running meanwhile, they
+        # run while an entry is in grace
+        cache.set(
+            SOFT_TTL_GENERATION_PATTERN.format(key=key),
+            uuid.uuid4().hex,
+            settings.MEMCACHED_SOFT_TTL['GRACE'],
+        )
+        cache.delete(key)
+
+    @classmethod
+    def refresh_many(cls, objects, generations):
+        # objects read from db by a refresh, keys invalidated since their
+        # generations were read are skipped. memcached has no compare and
+        # set here, keys invalidated between the check and the write are
+        # deleted again. returns the number of keys written
+        def get_unchanged(keys):
+            current = cls.get_generations(keys)
+            return [key for key in keys if current[key] == generations.get(key)]
+
+        objects = {key: objects[key] for key in get_unchanged(list(objects))}
+        if not objects:
+            return 0
+        cls.set_many(objects)
+        unchanged = get_unchanged(list(objects))
+        if len(unchanged) < len(objects):
+            cache.delete_many([key for key in objects if key not in unchanged])
+        return len(unchanged)
+
+    @classmethod
+    def set_tombstones(cls, keys):
+        cache.set_many(
+            {key: TOMBSTONE for key in keys},
+            settings.MEMCACHED_TOMBSTONE_TIMEOUT,
+        )
+
+    @classmethod
+    def is_tombstone(cls, obj):
+        return isinstance(obj, str) and obj == TOMBSTONE
+
+    @classmethod
+    def acquire_refresh(cls, keys):
+        # keys no other process is refreshing, memcached add is atomic. the
+        # lock is left to expire, so a key is refreshed at most once per
+        # REFRESH_LOCK_TIME
+        timeout = settings.MEMCACHED_SOFT_TTL['REFRESH_LOCK_TIME']
+        return [
+            key for key in keys
+            if cache.add(SOFT_TTL_REFRESH_LOCK_PATTERN.format(key=key), 1, timeout)
+        ]
+
+    @classmethod
+    def record(cls, model_name, stale=0, miss=0):
+        # stale serves versus hard misses per model, hit counts are left out
+        # to keep redis off the hot path
+        if not stale and not miss:
+            return
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        if stale:
+            pipeline.hincrby(MEMCACHED_STATS_KEY, '{}:stale'.format(model_name), stale)
+        if miss:
+            pipeline.hincrby(MEMCACHED_STATS_KEY, '{}:miss'.format(model_name), miss)
+        pipeline.execute()
+
+    @classmethod
+    def get_stats(cls):
+        # {model_name: {'stale': n, 'miss': n}}
+        conn = RedisClient.get_connection()
+        stats = {}
+        for field, count in conn.hgetall(MEMCACHED_STATS_KEY).items():
+            model_name, kind = field.decode().rsplit(':', 1)
+            stats.setdefault(model_name, {'stale': 0, 'miss': 0})[kind] = int(count)
+        return stats
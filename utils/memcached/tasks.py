@@ -0,0 +1,15 @@
+from celery import shared_task
+from django.apps import apps
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(limit=ONE_HOUR, routing_key='default')
+def refresh_cached_objects_task(model_label, object_ids, generations):
+    from utils.memcached.memcached_helper import MemcachedHelper
+
+    refreshed = MemcachedHelper.refresh_cached_objects(
+        apps.get_model(model_label),
+        object_ids,
+        generations,
+    )
+    return '{} cached objects are refreshed'.format(refreshed)
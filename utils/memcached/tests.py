@@ -0,0 +1,169 @@
+from accounts.services import UserService
+from django.contrib.auth.models import User
+from django.test import override_settings
+from testing.testcases import TestCase
+from tweets.models import Tweet
+from twitter.cache import USER_PROFILE_PATTERN
+from utils.memcached.local_cache import LocalCache
+from utils.memcached.memcached_helper import MemcachedHelper
+from utils.memcached.request_cache import MISSING, RequestCache
+from utils.memcached.soft_ttl_cache import TOMBSTONE, SoftTTLCache, SoftTTLEntry, cache
+import os
+import time
+
+
+class MemcachedHelperTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+
+    def test_request_cache(self):
+        user = self.create_user('test_user')
+
+        # not in a request, nothing is kept in process
+        MemcachedHelper.get_object_through_cache(User, user.id)
+        self.assertEqual(RequestCache.get_stats(), {'hits': 0, 'misses': 0})
+
+        RequestCache.activate()
+        try:
+            cached_user = MemcachedHelper.get_object_through_cache(User, user.id)
+            self.assertEqual(
+                MemcachedHelper.get_object_through_cache(User, user.id) is cached_user,
+                True,
+            )
+            users = MemcachedHelper.get_objects_through_cache(User, [user.id])
+            self.assertEqual(users[user.id] is cached_user, True)
+            self.assertEqual(RequestCache.get_stats(), {'hits': 2, 'misses': 1})
+
+            # invalidation also drops the in process copy
+            user.username = 'new_username'
+            user.save()
+            cached_user = MemcachedHelper.get_object_through_cache(User, user.id)
+            self.assertEqual(cached_user.username, 'new_username')
+        finally:
+            RequestCache.deactivate()
+
+    @override_settings(LOCAL_OBJECT_CACHE={
+        'ENABLED': True,
+        'MODELS': ('User',),
+        'MAX_SIZE': 2,
+        'TTL': 60,
+    })
+    def test_local_cache(self):
+        # no listener thread in tests, it clears the cache when subscribing
+        subscriber_pid = LocalCache.subscriber_pid
+        LocalCache.subscriber_pid = os.getpid()
+        self.addCleanup(setattr, LocalCache, 'subscriber_pid', subscriber_pid)
+        LocalCache.clear()
+        self.addCleanup(LocalCache.clear)
+        users = [self.create_user('user{}'.format(i)) for i in range(3)]
+        key = MemcachedHelper.get_key(User, users[0].id)
+
+        cached_user = MemcachedHelper.get_object_through_cache(User, users[0].id)
+        local_user = LocalCache.get('User', key)
+        self.assertEqual(local_user.username, 'user0')
+        # every caller gets its own copy
+        self.assertEqual(local_user is cached_user, False)
+        self.assertEqual(LocalCache.get('User', key) is local_user, False)
+
+        # least recently used entry is evicted
+        MemcachedHelper.get_objects_through_cache(
+            User,
+            [users[1].id, users[2].id],
+        )
+        self.assertEqual(LocalCache.get('User', key), MISSING)
+
+        # saving the user invalidates the local copy
+        users[2].username = 'new_username'
+        users[2].save()
+        cached_user = MemcachedHelper.get_object_through_cache(User, users[2].id)
+        self.assertEqual(cached_user.username, 'new_username')
+
+    def test_stale_while_revalidate(self):
+        user = self.create_user('test_user')
+        self.clear_cache()
+        key = MemcachedHelper.get_key(User, user.id)
+
+        MemcachedHelper.get_object_through_cache(User, user.id)
+        cached_user, is_stale = SoftTTLCache.get(key)
+        self.assertEqual(is_stale, False)
+        self.assertEqual(SoftTTLCache.get_stats(), {'User': {'stale': 0, 'miss': 1}})
+
+        # changed without invalidation and past its soft ttl, the stale
+        # object is served and refreshed by a task, which is eager in tests
+        User.objects.filter(id=user.id).update(username='new_username')
+        cache.set(key, SoftTTLEntry(time.time() - 1, cached_user))
+        cached_user = MemcachedHelper.get_object_through_cache(User, user.id)
+        self.assertEqual(cached_user.username, 'test_user')
+        cached_user, is_stale = SoftTTLCache.get(key)
+        self.assertEqual(cached_user.username, 'new_username')
+        self.assertEqual(is_stale, False)
+        self.assertEqual(SoftTTLCache.get_stats(), {'User': {'stale': 1, 'miss': 1}})
+
+        # refreshed at most once per REFRESH_LOCK_TIME
+        cache.set(key, SoftTTLEntry(time.time() - 1, cached_user))
+        MemcachedHelper.get_objects_through_cache(User, [user.id])
+        self.assertEqual(SoftTTLCache.get(key)[1], True)
+        self.assertEqual(SoftTTLCache.get_stats(), {'User': {'stale': 2, 'miss': 1}})
+
+    def test_refresh_after_invalidate(self):
+        user = self.create_user('test_user')
+        self.clear_cache()
+        key = MemcachedHelper.get_key(User, user.id)
+        profile_key = USER_PROFILE_PATTERN.format(user_id=user.id)
+        MemcachedHelper.get_object_through_cache(User, user.id)
+        UserService.get_profile_through_memcached(user.id)
+
+        # a refresh enqueued before an invalidation would write back what
+        # it read from db before the save, it skips the invalidated key
+        generations = SoftTTLCache.get_generations([key, profile_key])
+        user.username = 'new_username'
+        user.save()
+        user.profile.nickname = 'new_nickname'
+        user.profile.save()
+        self.assertEqual(
+            MemcachedHelper.refresh_cached_objects(User, [user.id], [generations[key]]),
+            0,
+        )
+        self.assertEqual(SoftTTLCache.get(key), (MISSING, False))
+        self.assertEqual(
+            UserService.refresh_cached_profiles([user.id], [generations[profile_key]]),
+            0,
+        )
+        self.assertEqual(SoftTTLCache.get(profile_key), (MISSING, False))
+
+        # enqueued after the invalidation it refreshes as usual
+        generations = SoftTTLCache.get_generations([key, profile_key])
+        self.assertEqual(
+            MemcachedHelper.refresh_cached_objects(User, [user.id], [generations[key]]),
+            1,
+        )
+        self.assertEqual(SoftTTLCache.get(key)[0].username, 'new_username')
+        self.assertEqual(
+            UserService.refresh_cached_profiles([user.id], [generations[profile_key]]),
+            1,
+        )
+        self.assertEqual(SoftTTLCache.get(profile_key)[0].nickname, 'new_nickname')
+
+    def test_tombstones(self):
+        user = self.create_user('test_user')
+        tweet = self.create_tweet(user)
+        tweet_id = tweet.id
+        tweet.delete()
+        self.clear_cache()
+        key = MemcachedHelper.get_key(Tweet, tweet_id)
+
+        # the first lookup caches a tombstone, later ones skip db
+        with self.assertRaises(Tweet.DoesNotExist):
+            MemcachedHelper.get_object_through_cache(Tweet, tweet_id)
+        self.assertEqual(SoftTTLCache.get(key), (TOMBSTONE, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(MemcachedHelper.get_objects_through_cache(Tweet, [tweet_id]), {})
+            with self.assertRaises(Tweet.DoesNotExist):
+                MemcachedHelper.get_object_through_cache(Tweet, tweet_id)
+        self.assertEqual(SoftTTLCache.get_stats(), {'Tweet': {'stale': 0, 'miss': 1}})
+
+        # creating the object drops the tombstone
+        Tweet.objects.create(id=tweet_id, user=user, content='any content')
+        cached_tweet = MemcachedHelper.get_object_through_cache(Tweet, tweet_id)
+        self.assertEqual(cached_tweet.id, tweet_id)
@@ -1,5 +1,6 @@
 from dateutil import parser
 from django.conf import settings
+import heapq
 from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
 
@@ -32,16 +33,57 @@ class EndlessPagination(BasePagination):
         return reversed_ordered_list[index: index + self.page_size]
 
     def get_paginated_cached_list_in_redis(self, cached_list, request):
-        paginated_list = self.paginate_ordered_list(cached_list, request)
+        # only the entries around the cursor are read from redis, returns
+        # None when the page is not fully in the cache
+        is_complete = len(cached_list) < settings.REDIS_LIST_LENGTH_LIMIT
         if 'created_at__gt' in request.query_params:
+            created_at__gt = parser.isoparse(request.query_params['created_at__gt'])
+            paginated_list = cached_list.newer_than(created_at__gt)
+            if len(paginated_list) == len(cached_list) and not is_complete:
+                return None
             return paginated_list
 
-        if self.has_next_page:
-            return paginated_list
-        if len(paginated_list) < settings.REDIS_LIST_LENGTH_LIMIT:
-            return paginated_list
+        if 'created_at__lt' in request.query_params:
+            created_at__lt = parser.isoparse(request.query_params['created_at__lt'])
+            paginated_list = cached_list.older_than(
+                created_at__lt,
+                self.page_size + 1,
+            )
+        else:
+            paginated_list = cached_list.latest(self.page_size + 1)
+
+        self.has_next_page = len(paginated_list) > self.page_size
+        if self.has_next_page or is_complete:
+            return paginated_list[:self.page_size]
         return None
 
+    def paginate_merged_timelines(self, timelines, request):
+        # timelines is a list of (cached_list, queryset), each one is
+        # paginated around the cursor on its own, from redis or db, and the
+        # pages are merged newest first. every timeline returns at most one
+        # page, which is enough for the first page of the merged one
+        pages = []
+        has_next_page = False
+        for cached_list, queryset in timelines:
+            self.has_next_page = False
+            page = self.get_paginated_cached_list_in_redis(cached_list, request)
+            if page is None:
+                page = self.paginate_queryset(queryset, request)
+            pages.append(list(page))
+            has_next_page = has_next_page or self.has_next_page
+
+        merged_list = list(heapq.merge(
+            *pages,
+            key=lambda obj: obj.created_at,
+            reverse=True,
+        ))
+        if 'created_at__gt' in request.query_params:
+            self.has_next_page = False
+            return merged_list
+
+        self.has_next_page = has_next_page or len(merged_list) > self.page_size
+        return merged_list[:self.page_size]
+
     def paginate_queryset(self, queryset, request, view=None):
         if 'created_at__gt' in request.query_params:
             queryset = queryset.filter(
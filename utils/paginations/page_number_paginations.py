@@ -1,5 +1,15 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from twitter.cache import QUERYSET_COUNT_PATTERN
+import base64
+import hashlib
+
+cache = caches['testing'] if settings.TESTING else caches['default']
 
 
 class FriendshipPagination(PageNumberPagination):
@@ -7,8 +17,69 @@ class FriendshipPagination(PageNumberPagination):
     page_query_param = 'page'
     page_size_query_param = 'size'
     max_page_size = 20
+    # ?cursor= (empty for the first page) switches to keyset pagination
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        # seek on (created_at, id) instead of COUNT(*) and OFFSET, so every
+        # page costs the same. innodb secondary indexes end with the primary
+        # key, the (to_user, created_at) and (from_user, created_at) indexes
+        # serve this order
+        self.total_count = self.get_cached_count(queryset)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created_at', '-id')
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            created_at, object_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=object_id)
+            )
+        page = list(queryset[:page_size + 1])
+        self.has_next_page = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next_page else None
+        return page
+
+    def get_cached_count(self, queryset):
+        # approximate, up to PAGINATION_COUNT_CACHE_TIME old, so accounts
+        # with millions of friendships are not counted on every page
+        key = QUERYSET_COUNT_PATTERN.format(
+            query_hash=hashlib.md5(str(queryset.query).encode()).hexdigest(),
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIME)
+        return count
+
+    def encode_cursor(self, obj):
+        value = '{}|{}'.format(obj.created_at.isoformat(), obj.id)
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value = base64.urlsafe_b64decode(cursor.encode()).decode()
+            created_at, object_id = value.rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError
+            return created_at, int(object_id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
 
     def get_paginated_response(self, data):
+        if self.cursor_mode:
+            return Response({
+                'total_count': self.total_count,
+                'has_next_page': self.has_next_page,
+                'next_cursor': self.next_cursor,
+                'results': data,
+            })
         return Response({
             'total_count': self.page.paginator.count,
             'total_page': self.page.paginator.num_pages,
@@ -0,0 +1,158 @@
+from utils.redis.redis_client import RedisClient
+from utils.redis.redis_serializers import (
+    AWARE_EPOCH,
+    DjangoModelSerializer,
+    ONE_MICROSECOND,
+)
+
+# one endless pagination page plus the entry used to detect has_next_page
+READ_CHUNK_SIZE = 21
+
+
+class RedisCachedList:
+    """
+    Lazy view of a cached redis list, newest object first. Entries are read
+    with LRANGE chunk by chunk and only deserialized when they are needed.
+    """
+
+    def __init__(self, key, length, head):
+        self.key = key
+        self.length = length
+        # deserialized objects from the beginning of the list
+        self.head = head
+        self.offset = len(head)
+        self.object_ids = set(obj.id for obj in head)
+
+    @classmethod
+    def load(cls, key, chunk_size=READ_CHUNK_SIZE):
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        cls.read_length(pipeline, key)
+        cls.read_range(pipeline, key, 0, chunk_size - 1)
+        length, serialized_list = pipeline.execute()
+        objects, has_stale = DjangoModelSerializer.deserialize_many(serialized_list)
+        if has_stale:
+            # written for another schema of the model, rebuilt like a miss
+            conn.delete(key)
+            return cls(key, 0, [])
+        return cls(key, length, objects)
+
+    @classmethod
+    def read_length(cls, conn, key):
+        return conn.llen(key)
+
+    @classmethod
+    def read_range(cls, conn, key, start, end):
+        return conn.lrange(key, start, end)
+
+    @classmethod
+    def deserialize_list(cls, serialized_list):
+        # stale entries further down are read from db, the list is rebuilt
+        # once its head is stale too
+        objects, _ = DjangoModelSerializer.deserialize_many(serialized_list)
+        return objects
+
+    def _fill(self, size):
+        conn = RedisClient.get_connection()
+        while len(self.head) < size and self.offset < self.length:
+            count = max(size - len(self.head), READ_CHUNK_SIZE)
+            serialized_list = self.read_range(
+                conn,
+                self.key,
+                self.offset,
+                self.offset + count - 1,
+            )
+            # the list expired or was trimmed since it was loaded
+            if not serialized_list:
+                break
+            self.offset += len(serialized_list)
+            for obj in self.deserialize_list(serialized_list):
+                # a push since the list was loaded shifts every entry by one
+                if obj.id in self.object_ids:
+                    continue
+                self.head.append(obj)
+                self.object_ids.add(obj.id)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        index = 0
+        while True:
+            self._fill(index + 1)
+            if index >= len(self.head):
+                return
+            yield self.head[index]
+            index += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            stop = self.length if index.stop is None else index.stop
+            if stop < 0:
+                stop += self.length
+            self._fill(stop)
+            return self.head[index]
+
+        if index < 0:
+            index += self.length
+        self._fill(index + 1)
+        return self.head[index]
+
+    def latest(self, count):
+        return self[:count]
+
+    def older_than(self, created_at, count):
+        objects = []
+        for obj in self:
+            if obj.created_at < created_at:
+                objects.append(obj)
+                if len(objects) == count:
+                    break
+        return objects
+
+    def newer_than(self, created_at):
+        objects = []
+        for obj in self:
+            if obj.created_at <= created_at:
+                break
+            objects.append(obj)
+        return objects
+
+
+class RedisCachedSortedSet(RedisCachedList):
+    """
+    Lazy view of a cached redis sorted set scored by created_at in
+    microseconds, cursor seeks are O(log n) with ZREVRANGEBYSCORE.
+    """
+
+    @classmethod
+    def get_score(cls, created_at):
+        return (created_at - AWARE_EPOCH) // ONE_MICROSECOND
+
+    @classmethod
+    def read_length(cls, conn, key):
+        return conn.zcard(key)
+
+    @classmethod
+    def read_range(cls, conn, key, start, end):
+        return conn.zrevrange(key, start, end)
+
+    def older_than(self, created_at, count):
+        conn = RedisClient.get_connection()
+        serialized_list = conn.zrevrangebyscore(
+            self.key,
+            '({}'.format(self.get_score(created_at)),
+            '-inf',
+            start=0,
+            num=count,
+        )
+        return self.deserialize_list(serialized_list)
+
+    def newer_than(self, created_at):
+        conn = RedisClient.get_connection()
+        serialized_list = conn.zrevrangebyscore(
+            self.key,
+            '+inf',
+            '({}'.format(self.get_score(created_at)),
+        )
+        return self.deserialize_list(serialized_list)
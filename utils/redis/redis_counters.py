@@ -0,0 +1,226 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, When
+from datetime import timedelta
+from twitter.cache import (
+    COUNTER_DELTAS_BATCH_KEY,
+    COUNTER_DELTAS_KEY,
+    COUNTER_DELTAS_PROCESSING_KEY,
+    COUNTER_FLUSH_LOCK_KEY,
+    COUNTER_RECONCILE_CHECKPOINT_PATTERN,
+)
+from utils.redis.redis_client import RedisClient
+from utils.time_helpers import utc_now
+import uuid
+
+FLUSH_BATCH_SIZE = 500
+FLUSH_LOCK_EXPIRE_TIME = 5 * 60  # in seconds
+# applied batch ids only matter until their hash is deleted from redis
+FLUSH_BATCH_RETENTION = timedelta(days=1)
+
+
+class RedisCounterHelper:
+    # write-behind for denormalized counters: every change is a HINCRBY on
+    # a redis hash, a periodic task moves the hash aside and applies the
+    # summed deltas to db in bulk, so a hot row is updated once per flush
+    # instead of once per like/comment
+
+    @classmethod
+    def is_enabled(cls):
+        return settings.COUNTER_WRITE_BEHIND_ENABLED
+
+    @classmethod
+    def get_field(cls, model_class, object_id, attr):
+        return '{}.{}:{}'.format(model_class._meta.label, attr, object_id)
+
+    @classmethod
+    def parse_field(cls, field):
+        if isinstance(field, bytes):
+            field = field.decode()
+        name, object_id = field.rsplit(':', 1)
+        label, attr = name.rsplit('.', 1)
+        return apps.get_model(label), attr, int(object_id)
+
+    @classmethod
+    def add_delta(cls, model_class, object_id, attr, amount):
+        conn = RedisClient.get_connection()
+        conn.hincrby(
+            COUNTER_DELTAS_KEY,
+            cls.get_field(model_class, object_id, attr),
+            amount,
+        )
+
+    @classmethod
+    def get_pending_deltas(cls, model_class, object_ids, attr):
+        # deltas not in db yet, both the open and the draining hash count
+        if not cls.is_enabled() or not object_ids:
+            return {}
+        fields = [
+            cls.get_field(model_class, object_id, attr)
+            for object_id in object_ids
+        ]
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline()
+        pipeline.hmget(COUNTER_DELTAS_KEY, fields)
+        pipeline.hmget(COUNTER_DELTAS_PROCESSING_KEY, fields)
+        deltas, processing_deltas = pipeline.execute()
+        return {
+            object_id: int(delta or 0) + int(processing_delta or 0)
+            for object_id, delta, processing_delta in zip(
+                object_ids,
+                deltas,
+                processing_deltas,
+            )
+        }
+
+    @classmethod
+    def flush(cls):
+        # returns the number of updated counters, None if another flush holds
+        # the lock
+        from utils.redis.redis_helper import RedisHelper
+
+        CounterFlushBatch = apps.get_model('tweets', 'CounterFlushBatch')
+        conn = RedisClient.get_connection()
+        token = uuid.uuid4().hex
+        if not conn.set(COUNTER_FLUSH_LOCK_KEY, token, nx=True, ex=FLUSH_LOCK_EXPIRE_TIME):
+            return None
+        try:
+            # a hash left by a crashed flush is drained before a new one is
+            # moved aside. RENAME is atomic, deltas written meanwhile go into
+            # a new hash. the batch id is set in the same transaction
+            if not conn.exists(COUNTER_DELTAS_PROCESSING_KEY):
+                if not conn.exists(COUNTER_DELTAS_KEY):
+                    return 0
+                pipeline = conn.pipeline()
+                pipeline.rename(COUNTER_DELTAS_KEY, COUNTER_DELTAS_PROCESSING_KEY)
+                pipeline.set(COUNTER_DELTAS_BATCH_KEY, uuid.uuid4().hex)
+                pipeline.execute()
+            conn.set(COUNTER_DELTAS_BATCH_KEY, uuid.uuid4().hex, nx=True)
+            batch_id = conn.get(COUNTER_DELTAS_BATCH_KEY).decode()
+
+            deltas = {}
+            for field, delta in conn.hgetall(COUNTER_DELTAS_PROCESSING_KEY).items():
+                delta = int(delta)
+                if delta:
+                    model_class, attr, object_id = cls.parse_field(field)
+                    deltas.setdefault((model_class, attr), {})[object_id] = delta
+
+            # the batch id is recorded in the same db transaction as the
+            # counters, a batch committed by a flush that crashed before the
+            # redis cleanup below is skipped instead of applied twice
+            with transaction.atomic():
+                _, created = CounterFlushBatch.objects.get_or_create(batch_id=batch_id)
+                if not created:
+                    deltas = {}
+                for (model_class, attr), object_deltas in deltas.items():
+                    cls._apply_deltas(model_class, attr, object_deltas)
+            conn.delete(COUNTER_DELTAS_PROCESSING_KEY, COUNTER_DELTAS_BATCH_KEY)
+            CounterFlushBatch.objects.filter(
+                created_at__lt=utc_now() - FLUSH_BATCH_RETENTION,
+            ).delete()
+            return sum(len(object_deltas) for object_deltas in deltas.values())
+        finally:
+            # the lock may have expired and been taken by the next flush
+            RedisHelper.release_lock(COUNTER_FLUSH_LOCK_KEY, token)
+
+    @classmethod
+    def _apply_deltas(cls, model_class, attr, object_deltas):
+        # UPDATE ... SET attr = CASE WHEN id = 1 THEN attr + 3 ... END
+        # WHERE id IN (...), one statement per batch
+        object_ids = sorted(object_deltas)
+        for index in range(0, len(object_ids), FLUSH_BATCH_SIZE):
+            batch_ids = object_ids[index: index + FLUSH_BATCH_SIZE]
+            model_class.objects.filter(id__in=batch_ids).update(**{
+                attr: Case(
+                    *[
+                        When(id=object_id, then=F(attr) + object_deltas[object_id])
+                        for object_id in batch_ids
+                    ],
+                    default=F(attr),
+                ),
+            })
+
+    @classmethod
+    def reconcile(cls, model_class, attr, get_actual_counts):
+        # walks the table by id from the last checkpoint, compares the
+        # denormalized counter with get_actual_counts(object_ids) (a grouped
+        # aggregate query) and repairs db and the cached counter. returns
+        # (checked, fixed)
+        from utils.redis.redis_helper import RedisHelper
+
+        conn = RedisClient.get_connection()
+        checkpoint_key = COUNTER_RECONCILE_CHECKPOINT_PATTERN.format(
+            field=cls.get_field(model_class, 'last_id', attr),
+        )
+        last_id = int(conn.get(checkpoint_key) or 0)
+        checked = fixed = 0
+        for _ in range(settings.COUNTER_RECONCILE_BATCHES_PER_RUN):
+            rows = list(
+                model_class.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', attr)[:settings.COUNTER_RECONCILE_BATCH_SIZE]
+            )
+            if not rows:
+                # end of the table, start over on the next run
+                last_id = 0
+                break
+            last_id = rows[-1][0]
+            checked += len(rows)
+
+            object_ids = [object_id for object_id, _ in rows]
+            wrong_ids = cls._get_wrong_ids(
+                model_class,
+                attr,
+                rows,
+                get_actual_counts(object_ids),
+            )
+            if not wrong_ids:
+                continue
+            # counted again with the rows locked, a like or comment written
+            # since the first count must not be overwritten
+            with transaction.atomic():
+                rows = list(
+                    model_class.objects.select_for_update()
+                    .filter(id__in=wrong_ids)
+                    .values_list('id', attr)
+                )
+                counts = get_actual_counts(wrong_ids)
+                pending_deltas = cls.get_pending_deltas(model_class, wrong_ids, attr)
+                wrong_ids = cls._get_wrong_ids(model_class, attr, rows, counts)
+                if wrong_ids:
+                    model_class.objects.filter(id__in=wrong_ids).update(**{
+                        attr: Case(
+                            *[
+                                When(
+                                    id=object_id,
+                                    then=counts.get(object_id, 0)
+                                    - pending_deltas.get(object_id, 0),
+                                )
+                                for object_id in wrong_ids
+                            ],
+                            default=F(attr),
+                        ),
+                    })
+            if wrong_ids:
+                conn.delete(*[
+                    RedisHelper.get_counter_key(model_class, object_id, attr)
+                    for object_id in wrong_ids
+                ])
+                fixed += len(wrong_ids)
+        conn.set(checkpoint_key, last_id)
+        return checked, fixed
+
+    @classmethod
+    def _get_wrong_ids(cls, model_class, attr, rows, counts):
+        # db lags behind the actual count by the deltas waiting for a flush
+        pending_deltas = cls.get_pending_deltas(
+            model_class,
+            [object_id for object_id, _ in rows],
+            attr,
+        )
+        return [
+            object_id
+            for object_id, count in rows
+            if count != counts.get(object_id, 0) - pending_deltas.get(object_id, 0)
+        ]
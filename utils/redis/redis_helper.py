@@ -1,83 +1,603 @@
 from django.conf import settings
+from redis.exceptions import ResponseError
+from twitter.cache import COUNTER_PATTERN, TIMELINE_REBUILD_LOCK_PATTERN
+from utils.redis.redis_cached_lists import RedisCachedList, RedisCachedSortedSet
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_counters import RedisCounterHelper
 from utils.redis.redis_serializers import DjangoModelSerializer
+import time
+import uuid
+
+# KEYS[1]: counter key, ARGV[1]: amount
+INCR_IF_EXISTS_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('incrby', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+# KEYS[1]: sorted set key, KEYS[2]: optional rebuild lock key,
+# ARGV[1]: score, ARGV[2]: member, ARGV[3]: size limit,
+# ARGV[4]: dirty token, ARGV[5]: lock time
+# a rebuild running for a missing sorted set is marked dirty
+ZADD_IF_EXISTS_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('zadd', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('zremrangebyrank', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+    return 1
+end
+if KEYS[2] then
+    redis.call('set', KEYS[2], ARGV[4], 'XX', 'EX', ARGV[5])
+end
+return 0
+"""
+
+# KEYS[1]: list key, KEYS[2]: optional rebuild lock key, ARGV[1]: member,
+# ARGV[2]: size limit, ARGV[3]: dirty token, ARGV[4]: lock time
+# a member already in the list is not pushed again, so retried pushes are
+# idempotent. a rebuild running for a missing list is marked dirty
+LPUSH_IF_EXISTS_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    if KEYS[2] then
+        redis.call('set', KEYS[2], ARGV[3], 'XX', 'EX', ARGV[4])
+    end
+    return 0
+end
+local limit = tonumber(ARGV[2])
+for _, item in ipairs(redis.call('lrange', KEYS[1], 0, limit - 1)) do
+    if item == ARGV[1] then
+        return 1
+    end
+end
+redis.call('lpush', KEYS[1], ARGV[1])
+redis.call('ltrim', KEYS[1], 0, limit - 1)
+return 1
+"""
+
+# KEYS[1]: set key, ARGV[1]: member, ARGV[2]: size limit with the marker,
+# ARGV[3]: complete marker, ARGV[4]: partial marker
+# a full set is not grown, a complete one is marked partial instead
+SADD_IF_EXISTS_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+if redis.call('sismember', KEYS[1], ARGV[1]) == 1 then
+    return 1
+end
+if redis.call('scard', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('sadd', KEYS[1], ARGV[1])
+elseif redis.call('srem', KEYS[1], ARGV[3]) == 1 then
+    redis.call('sadd', KEYS[1], ARGV[4])
+end
+return 1
+"""
+
+# KEYS[1]: lock key, ARGV[1]: token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1]: rebuild lock key, KEYS[2]: build key, KEYS[3]: timeline key,
+# ARGV[1]: lock token, ARGV[2]: dirty token
+# the build only replaces the timeline while the lock still holds the token
+PUBLISH_BUILD_SCRIPT = """
+local token = redis.call('get', KEYS[1])
+if token == ARGV[1] then
+    if redis.call('exists', KEYS[2]) == 1 then
+        redis.call('rename', KEYS[2], KEYS[3])
+    end
+    redis.call('del', KEYS[1])
+    return 1
+end
+redis.call('del', KEYS[2])
+if token == ARGV[2] then
+    redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# lock value of a build that missed an object pushed while it was running
+DIRTY_BUILD_TOKEN = 'dirty'
+REBUILD_POLL_INTERVAL = 0.02  # in seconds
 
 
 class RedisHelper:
+    scripts = {}
+    scripts_disabled = False
+    key_suffix = ''
+    push_script = LPUSH_IF_EXISTS_SCRIPT
+    cached_class = RedisCachedList
+
+    @classmethod
+    def _get_script(cls, script):
+        if script not in cls.scripts:
+            conn = RedisClient.get_connection()
+            cls.scripts[script] = conn.register_script(script)
+        return cls.scripts[script]
+
+    @classmethod
+    def _run_script(cls, script, keys, args, fallback):
+        if cls.scripts_disabled or not settings.REDIS_SCRIPTS_ENABLED:
+            return fallback()
+        try:
+            return cls._get_script(script)(keys=keys, args=args)
+        except ResponseError as e:
+            # EVAL can be disabled (e.g. by a proxy or renamed commands),
+            # errors raised by the script itself still need to surface
+            if 'unknown command' not in str(e).lower():
+                raise
+            cls.scripts_disabled = True
+        return fallback()
+
+    @classmethod
+    def release_lock(cls, key, token):
+        # only the owner of a lock taken with SET NX deletes it, a lock that
+        # expired may be held by someone else by now
+        conn = RedisClient.get_connection()
+
+        def release_in_transaction(pipeline):
+            is_owner = pipeline.get(key) == token.encode()
+            pipeline.multi()
+            if is_owner:
+                pipeline.delete(key)
+            return 1 if is_owner else 0
+
+        def fallback():
+            return conn.transaction(release_in_transaction, key, value_from_callable=True)
+
+        return cls._run_script(RELEASE_LOCK_SCRIPT, [key], [token], fallback)
+
+    @classmethod
+    def get_timeline_helper(cls, timeline):
+        storage = settings.REDIS_TIMELINE_STORAGES.get(timeline, 'list')
+        if storage == 'sorted_set':
+            return RedisSortedSetHelper
+        return RedisHelper
+
+    @classmethod
+    def _write_objects(cls, pipeline, key, objects):
+        pipeline.rpush(key, *[DjangoModelSerializer.serialize(obj) for obj in objects])
+
+    @classmethod
+    def _load_objects_to_cache(cls, key, queryset, wait=True):
+        # single flight: only the caller holding the rebuild lock queries db,
+        # the timeline is built under a temporary key and renamed into place,
+        # so concurrent rebuilds never append to the same list. returns None
+        # if another caller holds the lock and, with wait, has built the
+        # timeline meanwhile
+        conn = RedisClient.get_connection()
+        key = key + cls.key_suffix
+        lock_key = TIMELINE_REBUILD_LOCK_PATTERN.format(key=key)
+        token = uuid.uuid4().hex
+        if not conn.set(lock_key, token, nx=True, ex=settings.REDIS_REBUILD_LOCK_TIME):
+            if not wait or cls._wait_for_rebuild(key, lock_key):
+                return None
+            # the rebuild is slow or failed, read from db without caching
+            return list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
+
+        try:
+            objects = list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
+        except Exception:
+            cls.release_lock(lock_key, token)
+            raise
+        build_key = '{}:build:{}'.format(key, token)
+        if objects:
+            pipeline = conn.pipeline()
+            cls._write_objects(pipeline, build_key, objects)
+            pipeline.expire(build_key, settings.REDIS_KEY_EXPIRE_TIME)
+            pipeline.execute()
+        cls.publish_build(lock_key, build_key, key, token)
+        return objects
+
+    @classmethod
+    def publish_build(cls, lock_key, build_key, key, token):
+        conn = RedisClient.get_connection()
+
+        def publish_in_transaction(pipeline):
+            lock_token = pipeline.get(lock_key)
+            build_exists = pipeline.exists(build_key)
+            pipeline.multi()
+            if lock_token == token.encode():
+                if build_exists:
+                    pipeline.rename(build_key, key)
+                pipeline.delete(lock_key)
+                return 1
+            pipeline.delete(build_key)
+            if lock_token == DIRTY_BUILD_TOKEN.encode():
+                pipeline.delete(lock_key)
+            return 0
+
+        def fallback():
+            return conn.transaction(
+                publish_in_transaction,
+                lock_key,
+                build_key,
+                value_from_callable=True,
+            )
+
+        return cls._run_script(
+            PUBLISH_BUILD_SCRIPT,
+            [lock_key, build_key, key],
+            [token, DIRTY_BUILD_TOKEN],
+            fallback,
+        )
+
+    @classmethod
+    def mark_build_dirty(cls, lock_key):
+        # a build running under lock_key may have read db before a change
+        # that its key missed, it is discarded instead of published. returns
+        # whether a build was running
+        conn = RedisClient.get_connection()
+        return bool(conn.set(
+            lock_key,
+            DIRTY_BUILD_TOKEN,
+            xx=True,
+            ex=settings.REDIS_REBUILD_LOCK_TIME,
+        ))
 
     @classmethod
-    def _load_objects_to_cache(cls, key, queryset):
+    def _wait_for_rebuild(cls, key, lock_key):
+        # True once the timeline is cached, False when the lock is released
+        # without a timeline (nothing to cache) or the wait time is over
         conn = RedisClient.get_connection()
-        serialized_list = []
-        for obj in queryset[:settings.REDIS_LIST_LENGTH_LIMIT]:
-            serialized_obj = DjangoModelSerializer.serialize(obj)
-            serialized_list.append(serialized_obj)
-        if serialized_list:
-            conn.rpush(key, *serialized_list)
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        deadline = time.monotonic() + settings.REDIS_REBUILD_WAIT_TIME
+        while time.monotonic() < deadline:
+            time.sleep(REBUILD_POLL_INTERVAL)
+            pipeline = conn.pipeline(transaction=False)
+            pipeline.exists(key)
+            pipeline.exists(lock_key)
+            key_exists, lock_exists = pipeline.execute()
+            if key_exists:
+                return True
+            if not lock_exists:
+                return False
+        return False
+
+    @classmethod
+    def _rebuild_after_push(cls, key, obj, queryset):
+        # the timeline was not cached when obj was pushed. a rebuild that is
+        # already running may have queried db before obj was saved, so it is
+        # marked dirty and discarded instead of published
+        if cls._load_objects_to_cache(key, queryset, wait=False) is not None:
+            return
+        conn = RedisClient.get_connection()
+        lock_key = TIMELINE_REBUILD_LOCK_PATTERN.format(key=key + cls.key_suffix)
+        if cls.mark_build_dirty(lock_key):
+            return
+        # the rebuild was published in between
+        cls._push_if_exists(key + cls.key_suffix, obj)
 
     @classmethod
     def load_objects(cls, key, queryset):
+        # objects are deserialized lazily, a cache hit only reads the first
+        # chunk of the list. redis never keeps an empty list, so an empty
+        # list means cache miss
+        cached_list = cls.cached_class.load(key + cls.key_suffix)
+        if len(cached_list):
+            return cached_list
+
+        objects = cls._load_objects_to_cache(key, queryset)
+        if objects is None:
+            # built by a concurrent request, unless it expired right away
+            cached_list = cls.cached_class.load(key + cls.key_suffix)
+            if len(cached_list):
+                return cached_list
+            objects = list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
+        # the objects read from db may not have been cached (another rebuild
+        # holds the lock or this one was discarded), a plain list with all of
+        # them in its head answers every seek without reading redis
+        return RedisCachedList(key + cls.key_suffix, len(objects), objects)
+
+    @classmethod
+    def warm_objects(cls, keys_querysets, ttl_threshold):
+        # [(key, queryset)], timelines expiring within ttl_threshold get
+        # their ttl extended, pushes keep them current. missing ones are
+        # rebuilt. returns (extended, rebuilt)
         conn = RedisClient.get_connection()
-        objects = []
-        if conn.exists(key):
-            serialized_list = conn.lrange(key, 0, -1)
-            for serialized_data in serialized_list:
-                deserialized_data = DjangoModelSerializer.deserialize(
-                    serialized_data)
-                objects.append(deserialized_data)
-            return objects
+        pipeline = conn.pipeline(transaction=False)
+        for key, _ in keys_querysets:
+            pipeline.ttl(key + cls.key_suffix)
+        extend_pipeline = conn.pipeline(transaction=False)
+        extended = rebuilt = 0
+        for (key, queryset), ttl in zip(keys_querysets, pipeline.execute()):
+            # -2: missing, -1: no expiry
+            if ttl == -2:
+                if cls._load_objects_to_cache(key, queryset, wait=False):
+                    rebuilt += 1
+            elif 0 <= ttl < ttl_threshold:
+                extend_pipeline.expire(key + cls.key_suffix, settings.REDIS_KEY_EXPIRE_TIME)
+                extended += 1
+        extend_pipeline.execute()
+        return extended, rebuilt
 
-        cls._load_objects_to_cache(key, queryset)
-        return list(queryset)
+    @classmethod
+    def invalidate_objects(cls, keys):
+        # the timelines are dropped and rebuilds running for them discarded,
+        # the next read loads them from db
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        for key in keys:
+            pipeline.delete(key + cls.key_suffix)
+            pipeline.set(
+                TIMELINE_REBUILD_LOCK_PATTERN.format(key=key + cls.key_suffix),
+                DIRTY_BUILD_TOKEN,
+                xx=True,
+                ex=settings.REDIS_REBUILD_LOCK_TIME,
+            )
+        pipeline.execute()
 
     @classmethod
     def push_object(cls, key, obj, queryset):
         conn = RedisClient.get_connection()
-        if conn.exists(key):
-            conn.lpush(key, DjangoModelSerializer.serialize(obj))
-            conn.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
-        else:
-            cls._load_objects_to_cache(key, queryset)
+        # LPUSHX only pushes when the list is cached, both commands are sent
+        # in one round trip
+        pipeline = conn.pipeline()
+        pipeline.lpushx(key, DjangoModelSerializer.serialize(obj))
+        pipeline.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+        length, _ = pipeline.execute()
+        if not length:
+            cls._rebuild_after_push(key, obj, queryset)
+
+    @classmethod
+    def _lpush_if_exists(cls, key, member):
+        conn = RedisClient.get_connection()
+        limit = settings.REDIS_LIST_LENGTH_LIMIT
+
+        def lpush_in_transaction(pipeline):
+            if not pipeline.exists(key):
+                return 0
+            is_member = member in pipeline.lrange(key, 0, limit - 1)
+            pipeline.multi()
+            if not is_member:
+                pipeline.lpush(key, member)
+                pipeline.ltrim(key, 0, limit - 1)
+            return 1
+
+        def fallback():
+            return conn.transaction(
+                lpush_in_transaction,
+                key,
+                value_from_callable=True,
+            )
+
+        return cls._run_script(LPUSH_IF_EXISTS_SCRIPT, [key], [member, limit], fallback)
+
+    @classmethod
+    def _get_push_args(cls, obj):
+        return [DjangoModelSerializer.serialize(obj), settings.REDIS_LIST_LENGTH_LIMIT]
+
+    @classmethod
+    def push_objects_if_cached(cls, key_objects):
+        # [(key, obj)] pushed in one pipeline, timelines that are not cached
+        # are skipped instead of rebuilt, they are loaded from db on next
+        # read. a rebuild running for a skipped timeline may have read db
+        # before obj was saved, it is marked dirty by the same script.
+        # objects already in a timeline are not pushed again, so a retried
+        # fanout does not duplicate entries. returns the number of cached
+        # timelines
+        if not key_objects:
+            return 0
+        if not cls.scripts_disabled and settings.REDIS_SCRIPTS_ENABLED:
+            conn = RedisClient.get_connection()
+            script = cls._get_script(cls.push_script)
+            pipeline = conn.pipeline(transaction=False)
+            for key, obj in key_objects:
+                key = key + cls.key_suffix
+                script(
+                    keys=[key, TIMELINE_REBUILD_LOCK_PATTERN.format(key=key)],
+                    args=cls._get_push_args(obj) + [
+                        DIRTY_BUILD_TOKEN,
+                        settings.REDIS_REBUILD_LOCK_TIME,
+                    ],
+                    client=pipeline,
+                )
+            try:
+                return sum(pipeline.execute())
+            except ResponseError as e:
+                if 'unknown command' not in str(e).lower():
+                    raise
+                cls.scripts_disabled = True
+        pushed = 0
+        for key, obj in key_objects:
+            key = key + cls.key_suffix
+            if cls._push_if_exists(key, obj):
+                pushed += 1
+            elif not cls.mark_build_dirty(TIMELINE_REBUILD_LOCK_PATTERN.format(key=key)):
+                # a rebuild may have been published in between
+                pushed += cls._push_if_exists(key, obj)
+        return pushed
+
+    @classmethod
+    def _push_if_exists(cls, key, obj):
+        return cls._lpush_if_exists(key, DjangoModelSerializer.serialize(obj))
+
+    @classmethod
+    def add_to_capped_set_if_exists(
+            cls,
+            key,
+            member,
+            size_limit,
+            complete_marker,
+            partial_marker,
+    ):
+        # a set holds a complete or a partial marker, members missing from a
+        # partial set are left to the caller to look up. a full set keeps
+        # its members, a complete one is only marked partial, so it is never
+        # dropped and refilled
+        conn = RedisClient.get_connection()
+
+        def sadd_in_transaction(pipeline):
+            if not pipeline.exists(key):
+                return 0
+            is_member = pipeline.sismember(key, member)
+            size = pipeline.scard(key)
+            is_complete = pipeline.sismember(key, complete_marker)
+            pipeline.multi()
+            if not is_member and size < size_limit:
+                pipeline.sadd(key, member)
+            elif not is_member and is_complete:
+                pipeline.srem(key, complete_marker)
+                pipeline.sadd(key, partial_marker)
+            return 1
+
+        def fallback():
+            return conn.transaction(sadd_in_transaction, key, value_from_callable=True)
+
+        return cls._run_script(
+            SADD_IF_EXISTS_SCRIPT,
+            [key],
+            [member, size_limit, complete_marker, partial_marker],
+            fallback,
+        )
+
+    @classmethod
+    def get_counter_key(cls, model_class, object_id, attr):
+        return COUNTER_PATTERN.format(
+            model=model_class.__name__,
+            attr=attr,
+            object_id=object_id,
+        )
 
     @classmethod
     def get_key(cls, obj, attr):
-        return '{}.{}:{}'.format(obj.__class__.__name__, attr, obj.id)
+        return cls.get_counter_key(obj.__class__, obj.id, attr)
 
     @classmethod
-    def incr_count(cls, obj, attr):
+    def _incr_if_exists(cls, key, amount):
         conn = RedisClient.get_connection()
-        key = cls.get_key(obj, attr)
-        if conn.exists(key):
-            conn.incr(key, 1)
-            return
 
-        # in case obj is cached obj, better to refresh from db
-        obj.refresh_from_db()
-        conn.set(key, getattr(obj, attr))
-        conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        def incr_in_transaction(pipeline):
+            if pipeline.exists(key):
+                pipeline.multi()
+                pipeline.incrby(key, amount)
+
+        def fallback():
+            result = conn.transaction(incr_in_transaction, key)
+            return result[0] if result else None
+
+        return cls._run_script(INCR_IF_EXISTS_SCRIPT, [key], [amount], fallback)
+
+    @classmethod
+    def incr_count(cls, obj, attr):
+        # the db row is updated before this is called, so a missing counter
+        # can simply be filled from db by the next get_count
+        return cls._incr_if_exists(cls.get_key(obj, attr), 1)
 
     @classmethod
     def decr_count(cls, obj, attr):
+        return cls._incr_if_exists(cls.get_key(obj, attr), -1)
+
+    @classmethod
+    def get_count(cls, obj, attr):
+        return cls.get_counts([obj], [attr]).get(obj.id, {}).get(attr, 0)
+
+    @classmethod
+    def get_counts(cls, objs, attrs):
+        # {obj.id: {attr: count}} for objects of one model with one MGET,
+        # misses are filled with one query and written back in one pipeline
+        objs = {obj.id: obj for obj in objs}
+        if not objs:
+            return {}
         conn = RedisClient.get_connection()
-        key = cls.get_key(obj, attr)
-        if conn.exists(key):
-            conn.decr(key, 1)
-            return
+        pairs = [(object_id, attr) for object_id in objs for attr in attrs]
+        keys = [cls.get_key(objs[object_id], attr) for object_id, attr in pairs]
+        counts = {object_id: {} for object_id in objs}
+        missing_pairs = []
+        for (object_id, attr), key, count in zip(pairs, keys, conn.mget(keys)):
+            if count is None:
+                missing_pairs.append((object_id, attr, key))
+            else:
+                # use int(), otherwise, return b'1'
+                counts[object_id][attr] = int(count)
+        if not missing_pairs:
+            return counts
+
+        model_class = next(iter(objs.values())).__class__
+        missing_ids = {object_id for object_id, _, _ in missing_pairs}
+        missing_attrs = sorted({attr for _, attr, _ in missing_pairs})
+        # only the counter columns are read, not the whole rows
+        rows = {
+            row[0]: dict(zip(missing_attrs, row[1:]))
+            for row in model_class.objects.filter(id__in=missing_ids).values_list(
+                'id',
+                *missing_attrs,
+            )
+        }
+        # deltas waiting for the next write-behind flush are not in db yet
+        pending_deltas = {
+            attr: RedisCounterHelper.get_pending_deltas(
+                model_class,
+                list(missing_ids),
+                attr,
+            )
+            for attr in missing_attrs
+        }
+        pipeline = conn.pipeline()
+        for object_id, attr, key in missing_pairs:
+            if object_id not in rows:
+                continue
+            count = rows[object_id][attr] or 0
+            count += pending_deltas[attr].get(object_id, 0)
+            counts[object_id][attr] = count
+            pipeline.set(key, count, ex=settings.REDIS_COUNTER_EXPIRE_TIME)
+        pipeline.execute()
+        return counts
 
-        # in case obj is cached obj, better to refresh from db
-        obj.refresh_from_db()
-        conn.set(key, getattr(obj, attr))
-        conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+
+class RedisSortedSetHelper(RedisHelper):
+    # sorted sets live under their own keys, so switching the storage of a
+    # timeline never reads a list key with sorted set commands
+    key_suffix = ':zset'
+    push_script = ZADD_IF_EXISTS_SCRIPT
+    cached_class = RedisCachedSortedSet
 
     @classmethod
-    def get_count(cls, obj, attr):
+    def _write_objects(cls, pipeline, key, objects):
+        pipeline.zadd(key, {
+            DjangoModelSerializer.serialize(obj): RedisCachedSortedSet.get_score(obj.created_at)
+            for obj in objects
+        })
+
+    @classmethod
+    def _zadd_if_exists(cls, sorted_set_key, obj):
         conn = RedisClient.get_connection()
-        key = cls.get_key(obj, attr)
-        if conn.exists(key):
-            # use int(), otherwise, return b'1'
-            return int(conn.get(key))
-
-        obj.refresh_from_db()
-        conn.set(key, getattr(obj, attr))
-        return getattr(obj, attr)
+        member = DjangoModelSerializer.serialize(obj)
+        score = RedisCachedSortedSet.get_score(obj.created_at)
+        limit = settings.REDIS_LIST_LENGTH_LIMIT
+
+        def zadd_in_transaction(pipeline):
+            if pipeline.exists(sorted_set_key):
+                pipeline.multi()
+                pipeline.zadd(sorted_set_key, {member: score})
+                pipeline.zremrangebyrank(sorted_set_key, 0, -limit - 1)
+
+        def fallback():
+            return 1 if conn.transaction(zadd_in_transaction, sorted_set_key) else 0
+
+        # ZADD is idempotent, a retried push does not duplicate the entry
+        return cls._run_script(
+            ZADD_IF_EXISTS_SCRIPT,
+            [sorted_set_key],
+            [score, member, limit],
+            fallback,
+        )
+
+    @classmethod
+    def push_object(cls, key, obj, queryset):
+        if not cls._zadd_if_exists(key + cls.key_suffix, obj):
+            cls._rebuild_after_push(key, obj, queryset)
+
+    @classmethod
+    def _get_push_args(cls, obj):
+        return [
+            RedisCachedSortedSet.get_score(obj.created_at),
+            DjangoModelSerializer.serialize(obj),
+            settings.REDIS_LIST_LENGTH_LIMIT,
+        ]
+
+    @classmethod
+    def _push_if_exists(cls, key, obj):
+        return cls._zadd_if_exists(key, obj)
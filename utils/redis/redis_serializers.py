@@ -1,14 +1,190 @@
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from django.apps import apps
+from django.conf import settings
 from django.core import serializers
+from django.utils import timezone
 from utils.redis.json_encoder import JSONEncoder
+import pickle
+import zlib
 
+EPOCH = datetime(1970, 1, 1)
+AWARE_EPOCH = timezone.make_aware(EPOCH, timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
 
-class DjangoModelSerializer:
+# a compact entry written for another schema of its model, its values can't
+# be trusted and it counts as a cache miss of the object
+StaleEntry = namedtuple('StaleEntry', ['model_class', 'pk'])
+
+
+class JSONModelSerializer:
+    # legacy format, django json serializer output always starts with '['
+    format = 'json'
+    header = b'['
 
     @classmethod
     def serialize(cls, instance):
         # serializers can ONLY serialize queryset or list
         return serializers.serialize('json', [instance], cls=JSONEncoder)
-    
+
     @classmethod
     def deserialize(cls, serialized_data):
         return list(serializers.deserialize('json', serialized_data))[0].object
+
+
+class CompactModelSerializer:
+    # header byte + pickled (model label, schema hash, primary key, field
+    # values in concrete field order). field names are not stored, the hash
+    # of the names and types tells whether the order still holds
+    format = 'compact'
+    header = b'\x01'
+    schema_hashes = {}
+
+    @classmethod
+    def _to_primitive(cls, field, value):
+        if value is None:
+            return None
+        internal_type = field.get_internal_type()
+        if internal_type == 'DateTimeField':
+            epoch = AWARE_EPOCH if timezone.is_aware(value) else EPOCH
+            return (value - epoch) // ONE_MICROSECOND
+        if internal_type == 'DateField':
+            return value.toordinal()
+        if internal_type in ('FileField', 'ImageField'):
+            return value.name
+        return value
+
+    @classmethod
+    def _from_primitive(cls, field, value):
+        if value is None:
+            return None
+        internal_type = field.get_internal_type()
+        if internal_type == 'DateTimeField':
+            epoch = AWARE_EPOCH if settings.USE_TZ else EPOCH
+            return epoch + timedelta(microseconds=value)
+        if internal_type == 'DateField':
+            return date.fromordinal(value)
+        return value
+
+    @classmethod
+    def get_fields(cls, model_class):
+        return model_class._meta.concrete_fields
+
+    @classmethod
+    def get_schema_hash(cls, model_class):
+        key = (cls, model_class)
+        if key not in cls.schema_hashes:
+            schema = ','.join(
+                '{}:{}'.format(field.attname, field.get_internal_type())
+                for field in cls.get_fields(model_class)
+            )
+            cls.schema_hashes[key] = zlib.crc32(schema.encode())
+        return cls.schema_hashes[key]
+
+    @classmethod
+    def serialize(cls, instance):
+        model_class = instance.__class__
+        values = tuple(
+            cls._to_primitive(field, getattr(instance, field.attname))
+            for field in cls.get_fields(model_class)
+        )
+        return cls.header + pickle.dumps(
+            (instance._meta.label, cls.get_schema_hash(model_class), instance.pk, values),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+    @classmethod
+    def deserialize(cls, serialized_data):
+        payload = pickle.loads(serialized_data[len(cls.header):])
+        if len(payload) == 2:
+            # written before the schema hash was stored, the primary key was
+            # the first value of every model cached so far
+            label, values = payload
+            return StaleEntry(apps.get_model(label), values[0])
+        label, schema_hash, pk, values = payload
+        model_class = apps.get_model(label)
+        if schema_hash != cls.get_schema_hash(model_class):
+            return StaleEntry(model_class, pk)
+        fields = cls.get_fields(model_class)
+        return model_class.from_db(
+            None,
+            [field.attname for field in fields],
+            [
+                cls._from_primitive(field, value)
+                for field, value in zip(fields, values)
+            ],
+        )
+
+
+class IdsModelSerializer(CompactModelSerializer):
+    # only the primary key, foreign keys and created_at are stored, the
+    # related objects are hydrated through the object cache
+    format = 'ids'
+    header = b'\x02'
+
+    @classmethod
+    def get_fields(cls, model_class):
+        return [
+            field
+            for field in model_class._meta.concrete_fields
+            if field.primary_key or field.is_relation or field.name == 'created_at'
+        ]
+
+
+class DjangoModelSerializer:
+    serializer_classes = {}
+
+    @classmethod
+    def register(cls, serializer_class):
+        cls.serializer_classes[serializer_class.header] = serializer_class
+        return serializer_class
+
+    @classmethod
+    def get_serializer_class(cls, format):
+        for serializer_class in cls.serializer_classes.values():
+            if serializer_class.format == format:
+                return serializer_class
+        raise ValueError('Unknown redis serializer format: {}'.format(format))
+
+    @classmethod
+    def serialize(cls, instance, format=None):
+        if format is None:
+            format = settings.REDIS_SERIALIZER_MODEL_FORMATS.get(
+                instance._meta.label,
+                settings.REDIS_SERIALIZER_FORMAT,
+            )
+        return cls.get_serializer_class(format).serialize(instance)
+
+    @classmethod
+    def deserialize(cls, serialized_data):
+        # a StaleEntry for compact entries of another model schema
+        header = serialized_data[:1]
+        if isinstance(header, str):
+            header = header.encode()
+        if header not in cls.serializer_classes:
+            raise ValueError('Unknown redis serializer header: {}'.format(header))
+        return cls.serializer_classes[header].deserialize(serialized_data)
+
+    @classmethod
+    def deserialize_many(cls, serialized_list):
+        # stale entries are cache misses, they are read from db with one
+        # query per model and left out if gone. returns (objects, has_stale)
+        objects = [cls.deserialize(serialized_data) for serialized_data in serialized_list]
+        stale_entries = [obj for obj in objects if isinstance(obj, StaleEntry)]
+        if not stale_entries:
+            return objects, False
+        db_objects = {}
+        for model_class in {entry.model_class for entry in stale_entries}:
+            db_objects[model_class] = model_class.objects.in_bulk([
+                entry.pk for entry in stale_entries if entry.model_class is model_class
+            ])
+        objects = [
+            db_objects[obj.model_class].get(obj.pk) if isinstance(obj, StaleEntry) else obj
+            for obj in objects
+        ]
+        return [obj for obj in objects if obj is not None], True
+
+
+DjangoModelSerializer.register(JSONModelSerializer)
+DjangoModelSerializer.register(CompactModelSerializer)
+DjangoModelSerializer.register(IdsModelSerializer)
@@ -1,5 +1,26 @@
+from comments.models import Comment
+from django.conf import settings
+from django.test import override_settings
 from testing.testcases import TestCase
+from tweets.models import CounterFlushBatch, Tweet
+from tweets.tasks import flush_counter_deltas_task, reconcile_counters_task
+from twitter.cache import (
+    COUNTER_DELTAS_BATCH_KEY,
+    COUNTER_DELTAS_KEY,
+    COUNTER_DELTAS_PROCESSING_KEY,
+    COUNTER_FLUSH_LOCK_KEY,
+    TIMELINE_REBUILD_LOCK_PATTERN,
+)
+from utils.redis.redis_cached_lists import READ_CHUNK_SIZE, RedisCachedList
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_counters import RedisCounterHelper
+from utils.redis.redis_helper import RedisHelper, RedisSortedSetHelper
+from utils.redis.redis_serializers import (
+    CompactModelSerializer,
+    DjangoModelSerializer,
+    StaleEntry,
+)
+import pickle
 
 
 class RedisTest(TestCase):
@@ -19,3 +40,304 @@ class RedisTest(TestCase):
         RedisClient.clear()
         cached_list = conn.lrange(key, 0, -1)
         self.assertEqual(cached_list, [])
+
+    def test_redis_serializers(self):
+        user = self.create_user('test_user')
+        tweet = self.create_tweet(user)
+
+        # compact entries are smaller than legacy json entries
+        json_data = DjangoModelSerializer.serialize(tweet, format='json')
+        compact_data = DjangoModelSerializer.serialize(tweet, format='compact')
+        self.assertEqual(len(compact_data) < len(json_data), True)
+
+        # both formats can be decoded, json entries are still readable
+        conn = RedisClient.get_connection()
+        for key, data in (('json', json_data), ('compact', compact_data)):
+            conn.set(key, data)
+            deserialized_tweet = DjangoModelSerializer.deserialize(conn.get(key))
+            self.assertEqual(deserialized_tweet, tweet)
+            self.assertEqual(deserialized_tweet.user_id, user.id)
+            self.assertEqual(deserialized_tweet.content, tweet.content)
+            self.assertEqual(deserialized_tweet.created_at, tweet.created_at)
+
+        # a compact entry of another schema of the model is a cache miss,
+        # the object is read from db
+        Tweet.objects.filter(id=tweet.id).update(content='new content')
+        stale_data = CompactModelSerializer.header + pickle.dumps(
+            ('tweets.Tweet', 0, tweet.id, (tweet.id, user.id, 'old content')),
+        )
+        self.assertEqual(
+            DjangoModelSerializer.deserialize(stale_data),
+            StaleEntry(Tweet, tweet.id),
+        )
+        objects, has_stale = DjangoModelSerializer.deserialize_many([compact_data, stale_data])
+        self.assertEqual(has_stale, True)
+        self.assertEqual([obj.content for obj in objects], [tweet.content, 'new content'])
+
+        # a cached list with a stale head is rebuilt
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at')
+        conn.rpush('test_tweets', stale_data)
+        cached_tweets = RedisHelper.load_objects('test_tweets', queryset)
+        self.assertEqual([t.content for t in cached_tweets], ['new content'])
+        self.assertEqual(conn.lrange('test_tweets', 0, -1), [
+            DjangoModelSerializer.serialize(Tweet.objects.get(id=tweet.id)),
+        ])
+
+    def test_counters_in_one_round_trip(self):
+        user = self.create_user('test_user')
+        tweet = self.create_tweet(user)
+        conn = RedisClient.get_connection()
+        key = RedisHelper.get_key(tweet, 'likes_count')
+
+        for scripts_enabled in (True, False):
+            with self.settings(REDIS_SCRIPTS_ENABLED=scripts_enabled):
+                RedisClient.clear()
+                # counter is not cached, incr/decr do not create it
+                RedisHelper.incr_count(tweet, 'likes_count')
+                self.assertEqual(conn.exists(key), False)
+                RedisHelper.decr_count(tweet, 'likes_count')
+                self.assertEqual(conn.exists(key), False)
+
+                # filled from db on read, then incr/decr in place
+                self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 0)
+                RedisHelper.incr_count(tweet, 'likes_count')
+                RedisHelper.incr_count(tweet, 'likes_count')
+                RedisHelper.decr_count(tweet, 'likes_count')
+                self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 1)
+
+    def test_push_object_only_when_cached(self):
+        user = self.create_user('test_user')
+        tweets = [self.create_tweet(user) for _ in range(2)]
+        conn = RedisClient.get_connection()
+        RedisClient.clear()
+        key = 'test_tweets'
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at')
+
+        # not cached, the list is loaded from the queryset
+        RedisHelper.push_object(key, tweets[-1], queryset)
+        self.assertEqual(conn.llen(key), 2)
+
+        # cached, the object is pushed to the head
+        tweet = self.create_tweet(user)
+        RedisHelper.push_object(key, tweet, queryset)
+        self.assertEqual(conn.llen(key), 3)
+        cached_tweets = RedisHelper.load_objects(key, queryset)
+        self.assertEqual(cached_tweets[0].id, tweet.id)
+
+    def test_single_flight_rebuild(self):
+        user = self.create_user('test_user')
+        for _ in range(2):
+            self.create_tweet(user)
+        conn = RedisClient.get_connection()
+        key = 'test_tweets'
+        lock_key = TIMELINE_REBUILD_LOCK_PATTERN.format(key=key)
+        queryset = Tweet.objects.filter(user=user).order_by('-created_at')
+
+        for scripts_enabled in (True, False):
+            with self.settings(
+                REDIS_SCRIPTS_ENABLED=scripts_enabled,
+                REDIS_REBUILD_WAIT_TIME=0,
+            ):
+                RedisClient.clear()
+                # another request is rebuilding, served from db, not cached
+                conn.set(lock_key, 'token')
+                cached_tweets = RedisHelper.load_objects(key, queryset)
+                self.assertEqual(
+                    [t.id for t in cached_tweets],
+                    [t.id for t in queryset],
+                )
+                self.assertEqual(conn.exists(key), False)
+
+                # a push during the rebuild discards the build
+                RedisHelper.push_object(key, self.create_tweet(user), queryset)
+                self.assertEqual(conn.get(lock_key), b'dirty')
+                conn.rpush('test_build', 'stale')
+                published = RedisHelper.publish_build(lock_key, 'test_build', key, 'token')
+                self.assertEqual(published, 0)
+                self.assertEqual(conn.exists(key, 'test_build', lock_key), 0)
+
+                # so does a fanout batch that skips the missing list
+                conn.set(lock_key, 'token')
+                pushed = RedisHelper.push_objects_if_cached([(key, self.create_tweet(user))])
+                self.assertEqual(pushed, 0)
+                self.assertEqual(conn.get(lock_key), b'dirty')
+                conn.delete(lock_key)
+
+                # the lock holder builds the list once and renames it in place
+                RedisHelper.load_objects(key, queryset)
+                self.assertEqual(conn.llen(key), queryset.count())
+                self.assertEqual(conn.exists(lock_key), False)
+                self.assertEqual(conn.keys('{}:build:*'.format(key)), [])
+
+                # a sorted set that is not cached seeks in the rows read
+                # from db instead of the missing key
+                zset_key = key + RedisSortedSetHelper.key_suffix
+                conn.set(TIMELINE_REBUILD_LOCK_PATTERN.format(key=zset_key), 'token')
+                cached_tweets = RedisSortedSetHelper.load_objects(key, queryset)
+                self.assertEqual(conn.exists(zset_key), False)
+                tweets = list(queryset)
+                self.assertEqual(
+                    [t.id for t in cached_tweets.older_than(tweets[0].created_at, 10)],
+                    [t.id for t in tweets[1:]],
+                )
+                self.assertEqual(
+                    [t.id for t in cached_tweets.newer_than(tweets[-1].created_at)],
+                    [t.id for t in tweets[:-1]],
+                )
+                conn.delete(TIMELINE_REBUILD_LOCK_PATTERN.format(key=zset_key))
+
+    def test_redis_cached_list(self):
+        user = self.create_user('test_user')
+        tweets = [self.create_tweet(user) for _ in range(30)][::-1]
+        conn = RedisClient.get_connection()
+        RedisClient.clear()
+        key = 'test_tweets'
+        conn.rpush(key, *[DjangoModelSerializer.serialize(t) for t in tweets])
+
+        # only the first chunk is deserialized
+        cached_list = RedisCachedList.load(key)
+        self.assertEqual(len(cached_list), 30)
+        self.assertEqual(len(cached_list.head), READ_CHUNK_SIZE)
+        self.assertEqual(
+            [t.id for t in cached_list.latest(5)],
+            [t.id for t in tweets[:5]],
+        )
+        self.assertEqual(len(cached_list.head), READ_CHUNK_SIZE)
+
+        # seek by cursor
+        objects = cached_list.older_than(tweets[24].created_at, 10)
+        self.assertEqual([t.id for t in objects], [t.id for t in tweets[25:]])
+        objects = cached_list.newer_than(tweets[2].created_at)
+        self.assertEqual([t.id for t in objects], [t.id for t in tweets[:2]])
+        self.assertEqual([t.id for t in cached_list], [t.id for t in tweets])
+
+    @override_settings(COUNTER_WRITE_BEHIND_ENABLED=True)
+    def test_write_behind_counters(self):
+        conn = RedisClient.get_connection()
+        user = self.create_user('test_user')
+        tweet = self.create_tweet(user)
+        other_tweet = self.create_tweet(user)
+        for i in range(3):
+            self.create_like(self.create_user('liker{}'.format(i)), tweet)
+        comment = self.create_comment(user, tweet)
+        self.create_like(user, comment)
+        self.create_comment(user, other_tweet)
+
+        # db is not touched until the flush, reads include the pending deltas
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 0)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 3)
+        self.assertEqual(RedisHelper.get_count(tweet, 'comments_count'), 1)
+
+        self.assertEqual(flush_counter_deltas_task(), '4 counters are flushed')
+        self.assertEqual(conn.exists(COUNTER_DELTAS_KEY), False)
+        self.assertEqual(conn.exists(COUNTER_DELTAS_PROCESSING_KEY), False)
+        tweet.refresh_from_db()
+        other_tweet.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 3)
+        self.assertEqual(tweet.comments_count, 1)
+        self.assertEqual(other_tweet.comments_count, 1)
+        self.assertEqual(comment.likes_count, 1)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 3)
+        self.assertEqual(flush_counter_deltas_task(), '0 counters are flushed')
+
+        # a hash left by a crashed flush is drained first
+        RedisCounterHelper.add_delta(Tweet, tweet.id, 'likes_count', 2)
+        conn.rename(COUNTER_DELTAS_KEY, COUNTER_DELTAS_PROCESSING_KEY)
+        RedisCounterHelper.add_delta(Tweet, tweet.id, 'likes_count', -1)
+        self.assertEqual(
+            RedisCounterHelper.get_pending_deltas(Tweet, [tweet.id], 'likes_count'),
+            {tweet.id: 1},
+        )
+        RedisCounterHelper.flush()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 5)
+        RedisCounterHelper.flush()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 4)
+
+        # a batch committed by a flush that crashed before deleting its hash
+        # is not applied again
+        RedisCounterHelper.add_delta(Tweet, tweet.id, 'likes_count', 2)
+        conn.rename(COUNTER_DELTAS_KEY, COUNTER_DELTAS_PROCESSING_KEY)
+        conn.set(COUNTER_DELTAS_BATCH_KEY, 'applied_batch')
+        CounterFlushBatch.objects.create(batch_id='applied_batch')
+        self.assertEqual(RedisCounterHelper.flush(), 0)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 4)
+        self.assertEqual(conn.exists(COUNTER_DELTAS_PROCESSING_KEY), False)
+
+        # only one flush at a time, a lock is only released by its owner
+        conn.set(COUNTER_FLUSH_LOCK_KEY, 'token')
+        self.assertEqual(flush_counter_deltas_task(), 'another flush is running')
+        self.assertEqual(RedisHelper.release_lock(COUNTER_FLUSH_LOCK_KEY, 'other'), 0)
+        self.assertEqual(conn.get(COUNTER_FLUSH_LOCK_KEY), b'token')
+        self.assertEqual(RedisHelper.release_lock(COUNTER_FLUSH_LOCK_KEY, 'token'), 1)
+        self.assertEqual(conn.exists(COUNTER_FLUSH_LOCK_KEY), False)
+
+    @override_settings(COUNTER_RECONCILE_BATCH_SIZE=2)
+    def test_reconcile_counters(self):
+        conn = RedisClient.get_connection()
+        user = self.create_user('test_user')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        self.create_like(user, tweets[0])
+        comment = self.create_comment(user, tweets[1])
+        self.create_like(user, comment)
+        self.assertEqual(RedisHelper.get_count(tweets[0], 'likes_count'), 1)
+
+        # drift in db and in the cached counters
+        Tweet.objects.filter(id=tweets[0].id).update(likes_count=5)
+        Tweet.objects.filter(id=tweets[2].id).update(comments_count=-1)
+        Comment.objects.filter(id=comment.id).update(likes_count=0)
+        conn.set(RedisHelper.get_key(tweets[0], 'likes_count'), 5)
+
+        self.assertEqual(
+            reconcile_counters_task(),
+            '7 counters are checked, 3 are fixed',
+        )
+        for tweet in tweets:
+            tweet.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(tweets[0].likes_count, 1)
+        self.assertEqual(tweets[1].comments_count, 1)
+        self.assertEqual(tweets[2].comments_count, 0)
+        self.assertEqual(comment.likes_count, 1)
+        self.assertEqual(RedisHelper.get_count(tweets[0], 'likes_count'), 1)
+
+        # the walk started over from the first id
+        self.assertEqual(
+            reconcile_counters_task(),
+            '7 counters are checked, 0 are fixed',
+        )
+
+    def test_get_counts(self):
+        conn = RedisClient.get_connection()
+        user = self.create_user('test_user')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        self.create_like(user, tweets[0])
+        self.create_comment(user, tweets[1])
+        conn.set(RedisHelper.get_key(tweets[2], 'likes_count'), 7)
+
+        attrs = ['likes_count', 'comments_count']
+        expected = {
+            tweets[0].id: {'likes_count': 1, 'comments_count': 0},
+            tweets[1].id: {'likes_count': 0, 'comments_count': 1},
+            tweets[2].id: {'likes_count': 7, 'comments_count': 0},
+        }
+        # misses are filled with one query
+        with self.assertNumQueries(1):
+            self.assertEqual(RedisHelper.get_counts(tweets, attrs), expected)
+        key = RedisHelper.get_key(tweets[0], 'likes_count')
+        self.assertEqual(key, 'Tweet.likes_count:{}'.format(tweets[0].id))
+        ttl = conn.ttl(key)
+        self.assertEqual(0 < ttl <= settings.REDIS_COUNTER_EXPIRE_TIME, True)
+        # increments keep the expiry
+        self.create_like(self.create_user('another_user'), tweets[0])
+        self.assertEqual(0 < conn.ttl(key) <= ttl, True)
+        expected[tweets[0].id]['likes_count'] = 2
+        with self.assertNumQueries(0):
+            self.assertEqual(RedisHelper.get_counts(tweets, attrs), expected)
+
+        self.assertEqual(RedisHelper.get_counts([], attrs), {})
+        self.assertEqual(RedisHelper.get_count(tweets[1], 'comments_count'), 1)